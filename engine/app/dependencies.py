@@ -1,18 +1,20 @@
 from fastapi import Request, HTTPException
 # from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from requests import Session, adapters
-from urllib3.util.retry import Retry
-from cryptography.hazmat.primitives import serialization
-
 import jwt
 import copy
 import json
+import time
+import asyncio
+import aiohttp
+import hashlib
 
 from app.routers.common.helper import (
-    cosmos_query
+    get_admin_entry
 )
 
+from app.routers.common.cache import TokenCache
+
 from app.globals import globals
 
 from app.logs.logs import ipam_logger as logger
@@ -136,28 +138,123 @@ from app.logs.logs import ipam_logger as logger
 
 # ipam_security = IPAMToken(auto_error=False)
 
-_session = None
+JWKS_RETRY_STATUS = [ 500, 502, 503, 504 ]
+JWKS_RETRY_TOTAL = 5
+JWKS_RETRY_BACKOFF = 0.1
+JWKS_MIN_REFETCH = 60
+
+class JWKSStore:
+    """
+    Caches the tenant signing keys as parsed RSA public keys keyed by kid.
+    Keys are refreshed in the background once older than the TTL, and an
+    unknown kid triggers an early refetch (at most once per JWKS_MIN_REFETCH).
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.keys = {}
+        self.fetched_at = None
+        self.last_attempt = None
+        self.refresh_task = None
+        self._session = None
+        self._lock = None
+
+    @property
+    def age(self):
+        return (time.monotonic() - self.fetched_at) if self.fetched_at is not None else None
+
+    async def get_key(self, kid):
+        """Return the parsed signing key for kid, or None if the tenant does not publish it."""
+
+        if self.fetched_at is None:
+            await self.refresh()
+        elif self.age >= self.ttl:
+            self.schedule_refresh()
+
+        if kid not in self.keys:
+            if self.last_attempt is None or (time.monotonic() - self.last_attempt) >= JWKS_MIN_REFETCH:
+                await self.refresh()
+
+        return self.keys.get(kid)
+
+    def schedule_refresh(self):
+        """Start a background refresh unless one is already running."""
+
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.create_task(self.rotate())
+
+    async def rotate(self):
+        """Refresh the key set, keeping the current keys if the fetch fails."""
+
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error("Unable to refresh JWKS signing keys, using cached keys.")
+            logger.error(e)
+
+    async def refresh(self):
+        """Fetch and parse the key set, coalescing concurrent callers."""
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        started = time.monotonic()
 
-async def fetch_jwks_keys():
-    global _session
+        async with self._lock:
+            if self.last_attempt is not None and self.last_attempt >= started:
+                return
 
-    if _session is None:  
-        _session = Session()
+            self.last_attempt = time.monotonic()
 
-        retries = Retry(
-            total=5,
-            backoff_factor=0.1,
-            status_forcelist=[ 500, 502, 503, 504 ]
-        )
+            jwks = await self.fetch_jwks_keys()
+            keys = {}
 
-        _session.mount('https://', adapters.HTTPAdapter(max_retries=retries))
-        _session.mount('http://', adapters.HTTPAdapter(max_retries=retries))
+            for key in jwks["keys"]:
+                if key.get("kty") == "RSA":
+                    rsa_key = {
+                        "kty": key["kty"],
+                        "kid": key["kid"],
+                        "use": key["use"],
+                        "n": key["n"],
+                        "e": key["e"]
+                    }
 
-    key_url = "https://" + globals.AUTHORITY_HOST + "/" + globals.TENANT_ID + "/discovery/v2.0/keys"
+                    keys[key["kid"]] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(rsa_key))
 
-    jwks = _session.get(key_url).json()
+            self.keys = keys
+            self.fetched_at = time.monotonic()
 
-    return jwks
+    async def fetch_jwks_keys(self):
+        """Download the tenant JWKS document, retrying transient failures."""
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+
+        key_url = "https://" + globals.AUTHORITY_HOST + "/" + globals.TENANT_ID + "/discovery/v2.0/keys"
+
+        for attempt in range(JWKS_RETRY_TOTAL + 1):
+            try:
+                async with self._session.get(key_url) as response:
+                    if response.status not in JWKS_RETRY_STATUS:
+                        response.raise_for_status()
+                        return await response.json()
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == JWKS_RETRY_TOTAL:
+                    raise
+
+            await asyncio.sleep(JWKS_RETRY_BACKOFF * (2 ** attempt))
+
+        raise HTTPException(status_code=500, detail="Unable to fetch token signing keys.")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+jwks_store = JWKSStore(globals.JWKS_CACHE_TTL)
+token_cache = TokenCache(globals.TOKEN_CACHE_SIZE)
 
 async def get_token_auth_header(request: Request):
     auth = request.headers.get("Authorization", None)
@@ -179,27 +276,26 @@ async def get_token_auth_header(request: Request):
     return token
 
 async def validate_token(request: Request):
+    token = await get_token_auth_header(request)
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+
+    cached_payload = token_cache.get(token_hash)
+
+    if cached_payload:
+        request.state.tenant_id = cached_payload['tid']
+
+        return dict(cached_payload)
+
     try:
-        token = await get_token_auth_header(request)
-        jwks = await fetch_jwks_keys()
         unverified_header = jwt.get_unverified_header(token)
-
-        rsa_key = {}
-
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
+        rsa_key = await jwks_store.get_key(unverified_header["kid"])
     except Exception as e:
         logger.error("Unable to parse authorization token.");
         logger.error(e);
         raise HTTPException(status_code=401, detail="Unable to parse authorization token.")
 
+    verify_start = time.perf_counter()
+
     try:
         token_version = int(jwt.decode(token, options={"verify_signature": False})["ver"].split(".")[0])
     except Exception:
@@ -211,16 +307,10 @@ async def validate_token(request: Request):
         raise HTTPException(status_code=401, detail="Microsoft Identity v1.0 access tokens are not supported.")
 
     if rsa_key:
-        rsa_pem_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(rsa_key))
-        rsa_pem_key_bytes = rsa_pem_key.public_bytes(
-            encoding=serialization.Encoding.PEM, 
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-
         try:
             payload = jwt.decode(
                 token,
-                key=rsa_pem_key_bytes,
+                key=rsa_key,
                 verify=True,
                 algorithms=["RS256"],
                 audience=globals.CLIENT_ID,
@@ -237,20 +327,17 @@ async def validate_token(request: Request):
     else:
         raise HTTPException(status_code=401, detail="Unable to find appropriate signing key.")
 
+    token_cache.set(token_hash, payload, payload['exp'], time.perf_counter() - verify_start)
+
     request.state.tenant_id = payload['tid']
 
-    return payload
+    return dict(payload)
 
 async def check_admin(request: Request, user_oid: str, user_tid: str):
-    admin_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'admin'", user_tid)
-
-    if admin_query:
-        admin_data = copy.deepcopy(admin_query[0])
+    admin_entry = await get_admin_entry(user_tid)
 
-        if admin_data['admins']:
-            is_admin = next((x for x in admin_data['admins'] if user_oid == x['id']), None)
-        else:
-            is_admin = True
+    if admin_entry['admins']:
+        is_admin = user_oid in admin_entry['admins']
     else:
         is_admin = True
 
@@ -114,7 +114,139 @@ class Globals:
     @property
     def SHARED_TRANSPORT(self):
         return self.shared_transport
-    
+
+    @property
+    def NETWORK_CACHE_TTL(self):
+        cache_ttl = os.environ.get('NETWORK_CACHE_TTL')
+
+        return int(cache_ttl) if cache_ttl else 60
+
+    @property
+    def NETWORK_CACHE_SIZE(self):
+        cache_size = os.environ.get('NETWORK_CACHE_SIZE')
+
+        return int(cache_size) if cache_size else 128
+
+    @property
+    def NETWORK_CACHE_MAX_STALE(self):
+        max_stale = os.environ.get('NETWORK_CACHE_MAX_STALE')
+
+        return int(max_stale) if max_stale else 900
+
+    @property
+    def NETWORK_CACHE_REFRESH(self):
+        refresh_interval = os.environ.get('NETWORK_CACHE_REFRESH')
+
+        return int(refresh_interval) if refresh_interval else 45
+
+    @property
+    def JWKS_CACHE_TTL(self):
+        jwks_ttl = os.environ.get('JWKS_CACHE_TTL')
+
+        return int(jwks_ttl) if jwks_ttl else 3600
+
+    @property
+    def COSMOS_MIRROR(self):
+        cosmos_mirror = os.environ.get('COSMOS_MIRROR')
+
+        return cosmos_mirror.lower() == 'true' if cosmos_mirror else False
+
+    @property
+    def COSMOS_MIRROR_INTERVAL(self):
+        mirror_interval = os.environ.get('COSMOS_MIRROR_INTERVAL')
+
+        return int(mirror_interval) if mirror_interval else 5
+
+    @property
+    def COSMOS_MIRROR_RELOAD(self):
+        mirror_reload = os.environ.get('COSMOS_MIRROR_RELOAD')
+
+        return int(mirror_reload) if mirror_reload else 3600
+
+    @property
+    def COSMOS_TOMBSTONE_TTL(self):
+        tombstone_ttl = os.environ.get('COSMOS_TOMBSTONE_TTL')
+
+        return int(tombstone_ttl) if tombstone_ttl else 86400
+
+    @property
+    def ADMIN_CACHE_TTL(self):
+        cache_ttl = os.environ.get('ADMIN_CACHE_TTL')
+
+        return int(cache_ttl) if cache_ttl else 30
+
+    @property
+    def ADMIN_CACHE_SIZE(self):
+        cache_size = os.environ.get('ADMIN_CACHE_SIZE')
+
+        return int(cache_size) if cache_size else 64
+
+    @property
+    def TOKEN_CACHE_SIZE(self):
+        cache_size = os.environ.get('TOKEN_CACHE_SIZE')
+
+        return int(cache_size) if cache_size else 1024
+
+    @property
+    def CREDENTIAL_POOL_SIZE(self):
+        pool_size = os.environ.get('CREDENTIAL_POOL_SIZE')
+
+        return int(pool_size) if pool_size else 256
+
+    @property
+    def NETWORK_SYNC_MODE(self):
+        sync_mode = os.environ.get('NETWORK_SYNC_MODE')
+
+        return sync_mode.lower() if sync_mode else 'full'
+
+    @property
+    def NETWORK_RECONCILE_INTERVAL(self):
+        reconcile_interval = os.environ.get('NETWORK_RECONCILE_INTERVAL')
+
+        return int(reconcile_interval) if reconcile_interval else 3600
+
+    @property
+    def WRITE_COMBINE_WINDOW(self):
+        combine_window = os.environ.get('WRITE_COMBINE_WINDOW')
+
+        return int(combine_window) if combine_window else 0
+
+    @property
+    def WRITE_COMBINE_MAX_BATCH(self):
+        max_batch = os.environ.get('WRITE_COMBINE_MAX_BATCH')
+
+        return int(max_batch) if max_batch else 50
+
+    @property
+    def SPACE_LAYOUT(self):
+        space_layout = os.environ.get('SPACE_LAYOUT')
+
+        return space_layout.lower() if space_layout else 'single'
+
+    @property
+    def RESV_ARCHIVE_AGE(self):
+        archive_age = os.environ.get('RESV_ARCHIVE_AGE')
+
+        return int(archive_age) if archive_age else 0
+
+    @property
+    def RESV_ARCHIVE_TTL(self):
+        archive_ttl = os.environ.get('RESV_ARCHIVE_TTL')
+
+        return int(archive_ttl) if archive_ttl else 0
+
+    @property
+    def PREFIX_CACHE_SIZE(self):
+        cache_size = os.environ.get('PREFIX_CACHE_SIZE')
+
+        return int(cache_size) if cache_size else 65536
+
+    @property
+    def UTILIZATION_ENGINE(self):
+        utilization_engine = os.environ.get('UTILIZATION_ENGINE')
+
+        return utilization_engine.lower() if utilization_engine else 'python'
+
     @property
     def DEPLOYMENT_STACK(self):
         ipam_stack = ""
@@ -22,6 +22,8 @@ from app.routers import (
     status
 )
 
+from app.dependencies import jwks_store
+
 from app.logs.logs import ipam_logger as logger
 
 import os
@@ -33,6 +35,7 @@ import shutil
 import tempfile
 import traceback
 import requests
+from datetime import datetime
 from pathlib import Path
 from urllib.parse import urlparse
 from contextlib import asynccontextmanager
@@ -43,7 +46,10 @@ from app.globals import globals
 from app.routers.common.helper import (
     cosmos_query,
     cosmos_upsert,
-    cosmos_replace
+    cosmos_replace,
+    close_credentials,
+    close_write_combiner,
+    sync_cosmos_mirror
 )
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -142,6 +148,32 @@ async def ipam_init():
     
     container = database.get_container_client(container_name)
 
+    if globals.RESV_ARCHIVE_TTL > 0 or globals.COSMOS_MIRROR:
+        container_props = await container.read()
+
+        if container_props.get('defaultTtl') is None:
+            logger.info('Enabling per-item TTL on Container...')
+
+            try:
+                await database.replace_container(
+                    container,
+                    partition_key = PartitionKey(path = "/tenant_id"),
+                    indexing_policy = container_props.get('indexingPolicy'),
+                    default_ttl = -1
+                )
+            except CosmosHttpResponseError:
+                tb = traceback.format_exc()
+                logger.debug(tb)
+
+                # Tombstones and archived reservations rely on per-item TTL to expire
+                if globals.COSMOS_MIRROR:
+                    logger.error('Unable to enable per-item TTL on Container, disabling Cosmos DB mirror!')
+                    os.environ['COSMOS_MIRROR'] = 'false'
+
+                if globals.RESV_ARCHIVE_TTL > 0 and globals.RESV_ARCHIVE_AGE > 0:
+                    logger.error('Unable to enable per-item TTL on Container, disabling reservation archiving!')
+                    os.environ['RESV_ARCHIVE_AGE'] = '0'
+
     await cosmos_client.close()
     await managed_identity_credential.close()
 
@@ -387,6 +419,20 @@ async def upgrade_db():
     # else:
     #     logger.info("No existing Virtual Hubs to patch...")
 
+    if globals.SPACE_LAYOUT == 'split':
+        layout_fixup_query = await cosmos_query("SELECT * FROM c WHERE (c.type = 'space' AND NOT IS_DEFINED(c.layout))", globals.TENANT_ID)
+
+        if layout_fixup_query:
+            for space in layout_fixup_query:
+                space_data = copy.deepcopy(space)
+                space_data['layout'] = 'split'
+
+                await cosmos_replace(space, space_data)
+
+            logger.warning('Split space layout conversion complete!')
+        else:
+            logger.info("No existing spaces to split...")
+
     await cosmos_client.close()
     await managed_identity_credential.close()
 
@@ -400,6 +446,35 @@ async def find_reservations():
             logger.debug(tb)
             raise e
 
+async def archive_reservations():
+    if not os.environ.get("FUNCTIONS_WORKER_RUNTIME"):
+        try:
+            await azure.archive_settled_reservations()
+        except Exception as e:
+            logger.error('Error running reservation archive loop!')
+            tb = traceback.format_exc()
+            logger.debug(tb)
+            raise e
+
+async def sync_mirror():
+    try:
+        await sync_cosmos_mirror()
+    except Exception as e:
+        logger.error('Error syncing Cosmos DB mirror!')
+        tb = traceback.format_exc()
+        logger.debug(tb)
+        raise e
+
+async def refresh_inventory():
+    if not os.environ.get("FUNCTIONS_WORKER_RUNTIME"):
+        try:
+            await azure.refresh_network_cache()
+        except Exception as e:
+            logger.error('Error running inventory refresh loop!')
+            tb = traceback.format_exc()
+            logger.debug(tb)
+            raise e
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # IPAM Startup Tasks
@@ -409,12 +484,26 @@ async def lifespan(app: FastAPI):
     # Schedule Recurring Tasks
     scheduler = AsyncIOScheduler()
     scheduler.add_job(func=find_reservations, trigger='interval', minutes=1)
+    scheduler.add_job(func=jwks_store.rotate, trigger='interval', seconds=max(globals.JWKS_CACHE_TTL // 2, 60))
+
+    if globals.COSMOS_MIRROR:
+        scheduler.add_job(func=sync_mirror, trigger='interval', seconds=globals.COSMOS_MIRROR_INTERVAL, next_run_time=datetime.now())
+
+    if globals.RESV_ARCHIVE_AGE > 0:
+        scheduler.add_job(func=archive_reservations, trigger='interval', hours=1, next_run_time=datetime.now())
+
+    if globals.NETWORK_CACHE_TTL > 0:
+        scheduler.add_job(func=refresh_inventory, trigger='interval', seconds=globals.NETWORK_CACHE_REFRESH)
+
     scheduler.start()
 
     yield
 
     # IPAM Shutdown Tasks
     scheduler.shutdown()
+    await close_write_combiner()
+    await close_credentials()
+    await jwks_store.close()
 
 app = FastAPI(
     title = "Azure IPAM",
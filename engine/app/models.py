@@ -248,6 +248,14 @@ class ReservationExpand(BaseModel):
           
                 return data
 
+class ReservationBatchResult(BaseModel):
+    """DOCSTRING"""
+
+    index: int
+    success: bool
+    reservation: Optional[ReservationExpand] = None
+    error: Optional[str] = None
+
 class BlockBasic(BaseModel):
     """DOCSTRING"""
 
@@ -405,6 +413,17 @@ class BlockCIDRReq(BaseModel):
 
         return data
 
+class BatchCIDRReqItem(BlockCIDRReq):
+    """DOCSTRING"""
+
+    blocks: Optional[list] = None
+
+class BatchCIDRReq(BaseModel):
+    """DOCSTRING"""
+
+    blocks: list
+    reservations: List[BatchCIDRReqItem]
+
 class ExtNetReq(BaseModel):
     """DOCSTRING"""
 
@@ -668,6 +687,37 @@ class CIDRCheckRes(BaseModel):
     prefixes: List[IPv4Network]
     containers: List[CIDRContainer]
 
+class CIDRCheckBlock(BaseModel):
+    space: str
+    block: str
+    cidr: IPv4Network
+
+class CIDRCheckExternal(BaseModel):
+    space: str
+    block: str
+    name: str
+    cidr: IPv4Network
+
+class CIDRCheckReservation(BaseModel):
+    space: str
+    block: str
+    id: str
+    cidr: IPv4Network
+
+class CIDRCheckBatchReq(BaseModel):
+    """DOCSTRING"""
+
+    cidrs: List[IPv4Network]
+
+class CIDRCheckBatchRes(BaseModel):
+    """DOCSTRING"""
+
+    cidr: IPv4Network
+    networks: List[CIDRCheckRes]
+    blocks: List[CIDRCheckBlock]
+    externals: List[CIDRCheckExternal]
+    reservations: List[CIDRCheckReservation]
+
 #####################
 #   STATUS MODELS   #
 #####################
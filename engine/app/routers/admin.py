@@ -19,7 +19,8 @@ import uuid
 from app.dependencies import (
     api_auth_checks,
     get_admin,
-    get_tenant_id
+    get_tenant_id,
+    token_cache
 )
 
 from app.models import *
@@ -30,9 +31,23 @@ from app.routers.common.helper import (
     cosmos_upsert,
     cosmos_replace,
     cosmos_retry,
-    arg_query
+    arg_query,
+    arg_flight,
+    credential_pool,
+    admin_cache,
+    cosmos_conflicts,
+    write_combiner,
+    invalidate_admin_cache
 )
 
+from app.routers.azure import (
+    network_cache,
+    invalidate_network_cache
+)
+
+from app.routers.common.allocator import buddy_cache
+from app.routers.common.prefix import prefix_stats
+
 router = APIRouter(
     prefix="/admin",
     tags=["admin"],
@@ -50,6 +65,8 @@ async def new_admin_db(admin_list, exclusion_list, tenant_id):
 
     query_results = await cosmos_upsert(jsonable_encoder(admin_data))
 
+    invalidate_admin_cache(tenant_id)
+
     return query_results
 
 @router.get(
@@ -122,6 +139,8 @@ async def create_admin(
 
         await cosmos_replace(admin_query[0], admin_data)
 
+        invalidate_admin_cache(tenant_id)
+
     return Response(status_code=status.HTTP_201_CREATED)
 
 @router.put(
@@ -169,6 +188,8 @@ async def update_admins(
         
         await cosmos_replace(admin_query[0], admin_data)
 
+        invalidate_admin_cache(tenant_id)
+
     return PlainTextResponse(status_code=status.HTTP_200_OK)
 
 @router.get(
@@ -242,6 +263,8 @@ async def delete_admin(
 
     await cosmos_replace(admin_query[0], admin_data)
 
+    invalidate_admin_cache(tenant_id)
+
     return Response(status_code=status.HTTP_200_OK)
 
 @router.get(
@@ -312,6 +335,9 @@ async def add_exclusions(
 
         await cosmos_replace(admin_query[0], admin_data)
 
+    invalidate_admin_cache(tenant_id)
+    invalidate_network_cache(tenant_id)
+
     return Response(status_code=status.HTTP_200_OK)
 
 @router.put(
@@ -355,6 +381,9 @@ async def update_exclusions(
 
         await cosmos_replace(admin_query[0], admin_data)
 
+    invalidate_admin_cache(tenant_id)
+    invalidate_network_cache(tenant_id)
+
     return Response(status_code=status.HTTP_200_OK)
 
 @router.delete(
@@ -395,4 +424,59 @@ async def remove_exclusion(
 
     await cosmos_replace(admin_query[0], admin_data)
 
+    invalidate_admin_cache(tenant_id)
+    invalidate_network_cache(tenant_id)
+
     return Response(status_code=status.HTTP_200_OK)
+
+@router.get(
+    "/cache",
+    summary = "Get Cache Statistics",
+    status_code = 200
+)
+async def get_cache_stats(
+    authorization: str = Header(None, description="Azure Bearer token"),
+    is_admin: str = Depends(get_admin)
+):
+    """
+    Get hit/miss statistics for the in-process caches.
+    """
+
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="API restricted to admins.")
+
+    cache_stats = {
+        "token": token_cache.stats(),
+        "admin": admin_cache.stats(),
+        "network": network_cache.stats(),
+        "arg_query": arg_flight.stats(),
+        "credentials": credential_pool.stats(),
+        "allocator": buddy_cache.stats(),
+        "prefix": prefix_stats()
+    }
+
+    return cache_stats
+
+@router.get(
+    "/conflicts",
+    summary = "Get Write Conflict Statistics",
+    status_code = 200
+)
+async def get_conflict_stats(
+    authorization: str = Header(None, description="Azure Bearer token"),
+    is_admin: str = Depends(get_admin)
+):
+    """
+    Get the number of Cosmos DB write conflicts (etag mismatches) seen per endpoint,
+    along with write combiner batching statistics.
+    """
+
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="API restricted to admins.")
+
+    conflict_stats = {
+        "conflicts": dict(cosmos_conflicts),
+        "combiner": write_combiner.stats()
+    }
+
+    return conflict_stats
@@ -6,6 +6,17 @@ resources
 | project id, prefixes, resv = tags["ipam-res-id"]
 """
 
+RESERVATION_SYNC = """
+resources
+| where type in~ ('Microsoft.Network/virtualNetworks', 'Microsoft.Network/virtualHubs')
+| where subscriptionId !in~ {}
+| where type =~ 'Microsoft.Network/virtualNetworks' or isempty(kind)
+| extend resv = tostring(coalesce(tags['X-IPAM-RES-ID'], tags['ipam-res-id']))
+| where isnotempty(resv) or id in~ {}
+| extend prefixes = iff(type =~ 'Microsoft.Network/virtualHubs', pack_array(tostring(properties.addressPrefix)), properties.addressSpace.addressPrefixes)
+| project id, prefixes, resv
+"""
+
 # SUBSCRIPTION = """
 # resourcecontainers
 # | where type =~ 'microsoft.resources/subscriptions'
@@ -137,6 +148,55 @@ resources
 # | project name = subnet.name, id = subnet.id, prefix = subnet.properties.addressPrefix, resource_group = resourceGroup, subscription_id = subscriptionId, tenant_id = tenantId,vnet_name = name, vnet_id = id, used = (iif(isnull(subnet_size), 0, subnet_size) + 5), type = todynamic(subnetType)
 # """
 
+VNET_SYNC = """
+resources
+| where type =~ 'Microsoft.Network/virtualNetworks'
+| where subscriptionId !in~ {0}
+| project name, id, resource_group = resourceGroup, subscription_id = subscriptionId, tenant_id = tenantId, prefixes = properties.addressSpace.addressPrefixes, peerings = properties.virtualNetworkPeerings, resv = tostring(coalesce(tags['X-IPAM-RES-ID'], tags['ipam-res-id']))
+| extend id_lower = tolower(id)
+| join kind = leftouter(
+    resources
+    | where type =~ 'Microsoft.Network/virtualNetworks'
+    | where subscriptionId !in~ {0}
+    | extend subnet = todynamic(properties.subnets)
+    | mv-expand subnet limit 1024
+    | where isnotnull(subnet)
+    | extend subnet_details = pack("name", subnet.name, "id", subnet.id, "addressPrefix", subnet.properties.addressPrefix, "addressPrefixes", subnet.properties.addressPrefixes, "appGateway", isnotnull(subnet.properties.applicationGatewayIPConfigurations), "ipConfigurations", coalesce(array_length(subnet.properties.ipConfigurations), 0))
+    | summarize subnets = make_list(subnet_details) by id_lower = tolower(id)
+) on id_lower
+| project name, id, resource_group, subscription_id, tenant_id, prefixes, subnets, peerings, resv
+"""
+
+VNET_SYNC_BY_ID = """
+resources
+| where type =~ 'Microsoft.Network/virtualNetworks'
+| where subscriptionId !in~ {0}
+| where tolower(id) in ({1})
+| project name, id, resource_group = resourceGroup, subscription_id = subscriptionId, tenant_id = tenantId, prefixes = properties.addressSpace.addressPrefixes, peerings = properties.virtualNetworkPeerings, resv = tostring(coalesce(tags['X-IPAM-RES-ID'], tags['ipam-res-id']))
+| extend id_lower = tolower(id)
+| join kind = leftouter(
+    resources
+    | where type =~ 'Microsoft.Network/virtualNetworks'
+    | where tolower(id) in ({1})
+    | extend subnet = todynamic(properties.subnets)
+    | mv-expand subnet limit 1024
+    | where isnotnull(subnet)
+    | extend subnet_details = pack("name", subnet.name, "id", subnet.id, "addressPrefix", subnet.properties.addressPrefix, "addressPrefixes", subnet.properties.addressPrefixes, "appGateway", isnotnull(subnet.properties.applicationGatewayIPConfigurations), "ipConfigurations", coalesce(array_length(subnet.properties.ipConfigurations), 0))
+    | summarize subnets = make_list(subnet_details) by id_lower = tolower(id)
+) on id_lower
+| project name, id, resource_group, subscription_id, tenant_id, prefixes, subnets, peerings, resv
+"""
+
+VNET_CHANGES = """
+resourcechanges
+| where subscriptionId !in~ {}
+| extend target_id = tostring(properties.targetResourceId), change_time = todatetime(properties.changeAttributes.timestamp)
+| where target_id contains '/providers/Microsoft.Network/virtualNetworks/'
+| where change_time > todatetime('{}')
+| extend vnet_id = tolower(strcat_array(array_slice(split(target_id, '/'), 0, 8), '/'))
+| summarize change_time = max(change_time) by vnet_id
+"""
+
 SUBNET = """
 resources
 | where type =~ 'Microsoft.Network/virtualNetworks'
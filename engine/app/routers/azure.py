@@ -1,6 +1,7 @@
 from fastapi import (
     APIRouter,
     HTTPException,
+    Response,
     Depends,
     Header
 )
@@ -19,6 +20,7 @@ import re
 import copy
 import time
 import asyncio
+from datetime import datetime, timedelta, timezone
 from netaddr import IPSet, IPNetwork
 
 from app.dependencies import (
@@ -33,14 +35,20 @@ from . import argquery
 from app.routers.common.helper import (
     get_client_credentials,
     get_obo_credentials,
-    cosmos_query,
-    cosmos_replace,
-    cosmos_retry,
+    get_credential_scope,
+    get_space_docs,
+    cosmos_mutate,
+    archive_reservations,
     arg_query,
     vnet_fixup,
     subnet_fixup
 )
 
+from app.routers.common.cache import TTLCache, SingleFlight
+from app.routers.common.inventory import NetworkInventory
+from app.routers.common.netindex import get_network_index
+from app.routers.common.prefix import prefix_in, prefix_size, prefix_overlaps
+
 from app.globals import globals
 
 from app.logs.logs import ipam_logger as logger
@@ -51,6 +59,22 @@ router = APIRouter(
     dependencies=[Depends(api_auth_checks)]
 )
 
+network_cache = TTLCache(
+    ttl = globals.NETWORK_CACHE_TTL,
+    maxsize = globals.NETWORK_CACHE_SIZE,
+    max_stale = globals.NETWORK_CACHE_MAX_STALE
+)
+
+inventory_flight = SingleFlight()
+revalidate_tasks = set()
+inventory_reads = set()
+
+SYNC_CHUNK_SIZE = 200
+SYNC_OVERLAP = 300
+
+network_inventory = {}
+sync_flight = SingleFlight()
+
 def str_to_list(input):
     try:
         scrubbed = re.sub(r"\s+", "", input, flags = re.UNICODE)
@@ -105,6 +129,211 @@ async def get_subscriptions_sdk(credentials):
 
     return subscriptions
 
+def invalidate_network_cache(tenant_id = None):
+    """DOCSTRING"""
+
+    if tenant_id is None:
+        network_cache.invalidate()
+        network_inventory.clear()
+    else:
+        network_cache.invalidate(lambda key: key[0] == tenant_id)
+
+        for scope in [k for k in network_inventory if k[0] == tenant_id]:
+            del network_inventory[scope]
+
+def set_age_header(response, age):
+    """DOCSTRING"""
+
+    if response is None:
+        return
+
+    current_age = int(response.headers.get('Age', 0))
+    response.headers['Age'] = str(max(current_age, int(age)))
+
+async def sync_network_inventory_helper(auth, admin, scope):
+    """DOCSTRING"""
+
+    inventory = network_inventory.get(scope)
+    sync_start = datetime.now(timezone.utc)
+
+    if inventory is None or inventory.needs_reconcile(globals.NETWORK_RECONCILE_INTERVAL, sync_start):
+        vnet_rows = await arg_query(auth, admin, argquery.VNET_SYNC)
+
+        inventory = inventory or NetworkInventory()
+        inventory.load(vnet_rows, sync_start)
+        network_inventory[scope] = inventory
+
+        logger.debug("Full vNet inventory reconciliation loaded {} vNets.".format(len(vnet_rows)))
+
+        return
+
+    since = inventory.last_sync - timedelta(seconds=SYNC_OVERLAP)
+    changes_query = argquery.VNET_CHANGES.format("{}", since.strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+    changes = await arg_query(auth, admin, changes_query)
+    changed_ids = [change['vnet_id'] for change in changes]
+
+    vnet_rows = []
+
+    for i in range(0, len(changed_ids), SYNC_CHUNK_SIZE):
+        id_chunk = changed_ids[i:i + SYNC_CHUNK_SIZE]
+        id_filter = ", ".join("'{}'".format(x) for x in id_chunk)
+
+        vnet_rows += await arg_query(auth, admin, argquery.VNET_SYNC_BY_ID.format("{0}", id_filter))
+
+    inventory.apply(changed_ids, vnet_rows, sync_start)
+
+    logger.debug("Incremental vNet inventory sync applied {} changes.".format(len(changed_ids)))
+
+async def sync_network_inventory(auth, admin):
+    """DOCSTRING"""
+
+    scope = get_credential_scope(auth, admin)
+
+    await sync_flight.run(scope, sync_network_inventory_helper, auth, admin, scope)
+
+    return network_inventory[scope]
+
+async def fetch_vnet_inventory(auth, admin):
+    """DOCSTRING"""
+
+    if globals.NETWORK_SYNC_MODE == 'incremental':
+        inventory = await sync_network_inventory(auth, admin)
+
+        return vnet_fixup(inventory.vnet_list())
+
+    vnet_list = await arg_query(auth, admin, argquery.VNET)
+
+    return vnet_fixup(vnet_list)
+
+async def fetch_vhub_inventory(auth, admin):
+    """DOCSTRING"""
+
+    vwan_hubs = await arg_query(auth, admin, argquery.VHUB)
+
+    return await update_vhub_data(auth, admin, vwan_hubs)
+
+async def fetch_subnet_inventory(auth, admin):
+    """DOCSTRING"""
+
+    if globals.NETWORK_SYNC_MODE == 'incremental':
+        inventory = await sync_network_inventory(auth, admin)
+
+        return subnet_fixup(inventory.subnet_list())
+
+    subnet_list = await arg_query(auth, admin, argquery.SUBNET)
+
+    return subnet_fixup(subnet_list)
+
+async def fetch_endpoint_inventory(auth, admin):
+    """DOCSTRING"""
+
+    tasks = [
+        asyncio.create_task(pe(auth, admin)),
+        asyncio.create_task(df(auth, admin))
+    ]
+
+    endpoints = await asyncio.gather(*tasks)
+
+    private_endpoints = copy.deepcopy(endpoints[0])
+    data_factories = copy.deepcopy(endpoints[1])
+
+    for factory in data_factories:
+        df_pe = next((x for x in private_endpoints if x['metadata']['pe_id'] == factory['private_endpoint_id']), None)
+
+        if df_pe:
+            df_pe['id'] = factory['id']
+            df_pe['name'] = factory['name']
+            df_pe['metadata']['orphaned'] = False
+
+    return private_endpoints
+
+INVENTORY_FETCHERS = {
+    "vnet": fetch_vnet_inventory,
+    "vhub": fetch_vhub_inventory,
+    "subnet": fetch_subnet_inventory,
+    "endpoint": fetch_endpoint_inventory
+}
+
+async def refresh_inventory_helper(auth, admin, kind, cache_key):
+    """DOCSTRING"""
+
+    results = await INVENTORY_FETCHERS[kind](auth, admin)
+
+    network_cache.set(cache_key, results)
+
+    return results
+
+async def refresh_inventory(auth, admin, kind):
+    """DOCSTRING"""
+
+    cache_key = (*get_credential_scope(auth, admin), kind)
+
+    return await inventory_flight.run(cache_key, refresh_inventory_helper, auth, admin, kind, cache_key)
+
+async def revalidate_inventory(auth, admin, kind):
+    """DOCSTRING"""
+
+    try:
+        await refresh_inventory(auth, admin, kind)
+    except Exception as e:
+        logger.error("Error refreshing stale '{}' inventory, serving previous snapshot.".format(kind))
+        logger.debug(e)
+
+async def get_inventory_snapshot(auth, admin, kind):
+    """
+    Same as get_inventory(), but returns the cached inventory list itself rather
+    than a copy, so callers must not modify it. A refresh replaces the list
+    instead of changing it, so an unchanged list object means an unchanged
+    inventory.
+    """
+
+    cache_key = (*get_credential_scope(auth, admin), kind)
+    entry = network_cache.get_entry(cache_key)
+
+    if admin:
+        inventory_reads.add(kind)
+
+    if entry is None:
+        results = await refresh_inventory(auth, admin, kind)
+
+        return (results, 0)
+
+    results, age = entry
+
+    if age >= network_cache.ttl:
+        task = asyncio.create_task(revalidate_inventory(auth, admin, kind))
+        revalidate_tasks.add(task)
+        task.add_done_callback(revalidate_tasks.discard)
+
+    return (results, age)
+
+async def get_inventory(auth, admin, kind):
+    """DOCSTRING"""
+
+    results, age = await get_inventory_snapshot(auth, admin, kind)
+
+    return (copy.deepcopy(results), age)
+
+async def refresh_network_cache():
+    """DOCSTRING"""
+
+    # Only refresh the admin-scope inventories that were read since the last run
+    kinds = [x for x in INVENTORY_FETCHERS.keys() if x in inventory_reads]
+    inventory_reads.clear()
+
+    if not kinds:
+        return
+
+    tasks = [asyncio.create_task(refresh_inventory(None, True, kind)) for kind in kinds]
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for kind, result in zip(kinds, results):
+        if isinstance(result, Exception):
+            logger.error("Error refreshing '{}' inventory, previous snapshot retained.".format(kind))
+            logger.debug(result)
+
 async def update_vhub_data(auth, admin, hubs):
     """DOCSTRING"""
 
@@ -143,8 +372,6 @@ async def update_vhub_data(auth, admin, hubs):
 
         await network_client.close()
 
-    await creds.close()
-
     return hubs
 
 async def get_vmss(auth, admin):
@@ -161,11 +388,8 @@ async def get_vmss(auth, admin):
         vmss_list = await get_vmss_list_sdk(creds, subscriptions)
         vmss_vm_interfaces = await get_vmss_interfaces_sdk(creds, vmss_list)
     except ClientAuthenticationError:
-        await creds.close()
         raise HTTPException(status_code=401, detail="Access token expired.")
 
-    await creds.close()
-
     return vmss_vm_interfaces
 
 async def get_vmss_list_sdk(credentials, subscriptions):
@@ -384,16 +608,18 @@ async def subscription(
 async def get_vnet(
     authorization: str = Header(None),
     tenant_id: str = Depends(get_tenant_id),
-    admin: str = Depends(get_admin)
+    admin: str = Depends(get_admin),
+    response: Response = None
 ):
     """
     Get a list of Azure Virtual Networks.
     """
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", tenant_id)
+    space_query = await get_space_docs(tenant_id)
+    net_index = get_network_index(tenant_id, space_query)
 
-    vnet_list = await arg_query(authorization, admin, argquery.VNET)
-    vnet_list = vnet_fixup(vnet_list)
+    vnet_list, age = await get_inventory(authorization, admin, "vnet")
+    set_age_header(response, age)
 
     updated_vnet_list = []
 
@@ -402,24 +628,18 @@ async def get_vnet(
         total_used = 0
 
         for prefix in vnet['prefixes']:
-            total_size += IPNetwork(prefix).size
+            total_size += prefix_size(prefix)
 
         vnet['size'] = total_size
 
         for subnet in vnet['subnets']:
-            subnet['size'] = IPNetwork(subnet['prefix']).size
-            total_used += IPNetwork(subnet['prefix']).size
+            subnet['size'] = prefix_size(subnet['prefix'])
+            total_used += prefix_size(subnet['prefix'])
         
         vnet['used'] = total_used
 
-        # Python 3.9+
-        # ip_blocks = [(block | {'parent_space': space['name']}) for space in space_query for block in space['blocks']]
-        ip_blocks = [{**block , **{'parent_space': space['name']}} for space in space_query for block in space['blocks']]
-        parent_space = next((x['parent_space'] for x in ip_blocks if vnet['id'] in [v['id'] for v in x['vnets']]), None)
-        parent_blocks = list(x['name'] for x in ip_blocks if vnet['id'] in [v['id'] for v in x['vnets']])
-
-        vnet['parent_space'] = parent_space
-        vnet['parent_block'] = parent_blocks or None
+        vnet['parent_space'] = net_index.parent_space(vnet['id'])
+        vnet['parent_block'] = net_index.parent_blocks(vnet['id'])
 
         updated_vnet_list.append(vnet)
   
@@ -431,7 +651,8 @@ async def get_vnet(
 )
 async def get_subnet(
     authorization: str = Header(None),
-    admin: str = Depends(get_admin)
+    admin: str = Depends(get_admin),
+    response: Response = None
 ):
     """
     Get a list of Azure Subnets.
@@ -464,13 +685,13 @@ async def get_subnet(
     #     }
     # ]
 
-    subnet_list = await arg_query(authorization, admin, argquery.SUBNET)
-    subnet_list = subnet_fixup(subnet_list)
+    subnet_list, age = await get_inventory(authorization, admin, "subnet")
+    set_age_header(response, age)
 
     updated_subnet_list = []
 
     for subnet in subnet_list:
-        subnet['size'] = IPNetwork(subnet['prefix']).size
+        subnet['size'] = prefix_size(subnet['prefix'])
 
         # subnet["type"] = None
 
@@ -495,31 +716,27 @@ async def get_subnet(
 async def get_vhub(
     authorization: str = Header(None),
     tenant_id: str = Depends(get_tenant_id),
-    admin: str = Depends(get_admin)
+    admin: str = Depends(get_admin),
+    response: Response = None
 ):
     """
     Get a list of Virtual Hubs.
     """
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", tenant_id)
+    space_query = await get_space_docs(tenant_id)
+    net_index = get_network_index(tenant_id, space_query)
 
-    vwan_hubs = await arg_query(authorization, admin, argquery.VHUB)
-    vwan_hubs_update = await update_vhub_data(authorization, admin, vwan_hubs)
+    vwan_hubs_update, age = await get_inventory(authorization, admin, "vhub")
+    set_age_header(response, age)
 
     updated_vhub_list = []
 
     for hub in vwan_hubs_update:
-        hub['size'] = IPNetwork(hub['prefix']).size
+        hub['size'] = prefix_size(hub['prefix'])
         hub['used'] = None
 
-        # Python 3.9+
-        # ip_blocks = [(block | {'parent_space': space['name']}) for space in space_query for block in space['blocks']]
-        ip_blocks = [{**block , **{'parent_space': space['name']}} for space in space_query for block in space['blocks']]
-        parent_space = next((x['parent_space'] for x in ip_blocks if hub['id'] in [v['id'] for v in x['vnets']]), None)
-        parent_blocks = list(x['name'] for x in ip_blocks if hub['id'] in [v['id'] for v in x['vnets']])
-
-        hub['parent_space'] = parent_space
-        hub['parent_block'] = parent_blocks or None
+        hub['parent_space'] = net_index.parent_space(hub['id'])
+        hub['parent_block'] = net_index.parent_blocks(hub['id'])
 
         updated_vhub_list.append(hub)
 
@@ -533,15 +750,16 @@ async def get_vhub(
 async def get_network(
     authorization: str = Header(None),
     tenant_id: str = Depends(get_tenant_id),
-    admin: str = Depends(get_admin)
+    admin: str = Depends(get_admin),
+    response: Response = None
 ):
     """
     Get a list of Azure Networks (vNets & vHubs).
     """
 
     tasks = [
-        asyncio.create_task(get_vnet(authorization, tenant_id, admin)),
-        asyncio.create_task(get_vhub(authorization, tenant_id, admin))
+        asyncio.create_task(get_vnet(authorization, tenant_id, admin, response)),
+        asyncio.create_task(get_vhub(authorization, tenant_id, admin, response))
     ]
 
     networks = await asyncio.gather(*tasks)
@@ -608,8 +826,6 @@ async def df(
     data_factory_map = await get_factory_map_sdk(creds)
     data_factory_list = await get_factory_endpoints_sdk(creds, data_factory_map)
 
-    await creds.close()
-
     return data_factory_list
 
 @router.get(
@@ -619,29 +835,15 @@ async def df(
 async def endpoint(
     authorization: str = Header(None),
     tenant_id: str = Depends(get_tenant_id),
-    admin: str = Depends(get_admin)
+    admin: str = Depends(get_admin),
+    response: Response = None
 ):
     """
     Get a list of Azure Private Endpoints (PE's & Data Factories).
     """
 
-    tasks = [
-        asyncio.create_task(pe(authorization, admin)),
-        asyncio.create_task(df(authorization, admin))
-    ]
-
-    endpoints = await asyncio.gather(*tasks)
-
-    private_endpoints = copy.deepcopy(endpoints[0])
-    data_factories = copy.deepcopy(endpoints[1])
-
-    for factory in data_factories:
-        df_pe = next((x for x in private_endpoints if x['metadata']['pe_id'] == factory['private_endpoint_id']), None)
-
-        if df_pe:
-            df_pe['id'] = factory['id']
-            df_pe['name'] = factory['name']
-            df_pe['metadata']['orphaned'] = False
+    private_endpoints, age = await get_inventory(authorization, admin, "endpoint")
+    set_age_header(response, age)
 
     return private_endpoints
 
@@ -853,73 +1055,85 @@ async def multi(
 
     return [item for sublist in result_list for item in sublist]
 
-@cosmos_retry(
-    max_retry = 5,
-    error_msg = "Error updating reservation status!"
-)
+RESV_SYNC_CHUNK = 200
+
+async def get_resv_sync_networks(net_ids):
+    """
+    Fetch the address prefixes and reservation tags of every tagged vNet/vHub
+    plus the networks in net_ids, keyed by lowercase resource id.
+    """
+
+    net_ids = sorted(net_ids)
+    chunks = [net_ids[i:i + RESV_SYNC_CHUNK] for i in range(0, len(net_ids), RESV_SYNC_CHUNK)] or [[]]
+
+    net_map = {}
+
+    for chunk in chunks:
+        id_list = "(" + str(chunk)[1:-1] + ")" if chunk else "('')"
+        results = await arg_query(None, True, argquery.RESERVATION_SYNC.format("{}", id_list))
+
+        for net in results:
+            net_map[net['id'].lower()] = net
+
+    return net_map
+
 async def match_resv_to_vnets():
-    net_list = await get_network(None, globals.TENANT_ID, True)
-    stale_resv = list(i for j in list(str_to_list(x['resv']) for x in net_list if x['resv'] != None) for i in j)
+    start_time = time.perf_counter()
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", globals.TENANT_ID)
+    space_query = await get_space_docs(globals.TENANT_ID)
 
-    for space in space_query:
-        original_space = copy.deepcopy(space)
+    block_net_ids = set(net['id'].lower() for space in space_query for block in space['blocks'] for net in block['vnets'])
+
+    net_map = await get_resv_sync_networks(block_net_ids)
+    resv_map = {}
+
+    for net in net_map.values():
+        for resv_id in str_to_list(net['resv']):
+            if resv_id:
+                resv_map.setdefault(resv_id, net)
 
+    def reconcile(space):
         for block in space['blocks']:
             for net in block['vnets']:
-                active = next((x for x in net_list if x['id'] == net['id']), None)
+                active = net_map.get(net['id'].lower())
 
                 if active:
-                    net_prefix_set = IPSet(active['prefixes'])
-                    block_network = IPSet([block['cidr']])
-
-                    if net_prefix_set & block_network:
+                    if any(prefix_overlaps(x, block['cidr']) for x in active['prefixes']):
                         net['active'] = True
                     else:
                         net['active'] = False
                 else:
                     net['active'] = False
 
-            # print("Beginning Reservation Matching...")
-            for index, resv in enumerate(block['resv']):
-                # print("Block {} has reservations...".format(block['name']))
+            for resv in block['resv']:
                 if resv['settledOn'] is None:
-                    # print("Reservation {} is not settled...".format(resv['id']))
-                    if resv['id'] in stale_resv:
-                        net = next((x for x in net_list if resv['id'] in str_to_list(x['resv'])), None)
+                    net = resv_map.get(resv['id'])
 
-                        stale_resv.remove(resv['id'])
+                    if net:
                         resv['status'] = "wait"
 
                         cidr_match = resv['cidr'] in net['prefixes']
 
                         if not cidr_match:
-                            # print("Reservation ID assigned to vNET which does not have an address space that matches the reservation.")
-                            # logging.info("Reservation ID assigned to vNET which does not have an address space that matches the reservation.")
                             resv['status'] = "warnCIDRMismatch"
 
                         existing_block_cidrs = []
 
                         for v in block['vnets']:
-                            target_net = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
+                            target_net = net_map.get(v['id'].lower())
 
                             if target_net:
                                 if target_net['id'] == net['id']:
-                                    target_cidrs = [x for x in target_net['prefixes'] if (IPNetwork(x) in IPNetwork(block['cidr'])) and x != resv['cidr']]
+                                    target_cidrs = [x for x in target_net['prefixes'] if prefix_in(x, block['cidr']) and x != resv['cidr']]
                                 else:
-                                    target_cidrs = [x for x in target_net['prefixes'] if IPNetwork(x) in IPNetwork(block['cidr'])]
+                                    target_cidrs = [x for x in target_net['prefixes'] if prefix_in(x, block['cidr'])]
 
                                 existing_block_cidrs += target_cidrs
 
                         if IPNetwork(resv['cidr']) in IPSet(existing_block_cidrs):
-                            # print("A vNET with the assigned CIDR has already been associated with the target IP Block.")
-                            # logging.info("A vNET with the assigned CIDR has already been associated with the target IP Block.")
                             resv['status'] = "errCIDRExists"
 
                         if resv['status'] == "wait":
-                            # print("vNET is being added to IP Block...")
-                            # logging.info("vNET is being added to IP Block...")
                             block['vnets'].append(
                                 {
                                     "id": net['id'],
@@ -927,14 +1141,59 @@ async def match_resv_to_vnets():
                                 }
                             )
 
-                            # del block['resv'][index]
-
                             resv['status'] = "fulfilled"
                             resv['settledOn'] = time.time()
                             resv['settledBy'] = "AzureIPAM"
                     else:
-                        # print("Resetting status to 'wait'.")
-                        # logging.info("Resetting status to 'wait'.")
                         resv['status'] = "wait"
 
-        await cosmos_replace(original_space, space)
+    changed = 0
+
+    for space in space_query:
+        target = copy.deepcopy(space)
+        reconcile(target)
+
+        if target == space:
+            continue
+
+        changed += 1
+
+        await cosmos_mutate(space, reconcile, "match_resv_to_vnets", "Error updating reservation status!")
+
+    logger.info("Reservation sync checked {} space(s) against {} network(s), updated {} in {:.3f}s.".format(
+        len(space_query),
+        len(net_map),
+        changed,
+        time.perf_counter() - start_time
+    ))
+
+async def archive_settled_reservations():
+    cutoff = time.time() - (globals.RESV_ARCHIVE_AGE * 86400)
+    archived = 0
+
+    space_query = await get_space_docs(globals.TENANT_ID)
+
+    for space in space_query:
+        expired = {}
+
+        for block in space['blocks']:
+            settled = [x for x in block['resv'] if x['settledOn'] and x['settledOn'] < cutoff]
+
+            if settled:
+                await archive_reservations(space, block['name'], settled)
+                expired[block['name']] = set(x['id'] for x in settled)
+
+        if not expired:
+            continue
+
+        def remove_archived(space_doc):
+            for block in space_doc['blocks']:
+                archived_ids = expired.get(block['name'], set())
+                block['resv'] = [x for x in block['resv'] if x['id'] not in archived_ids]
+
+        await cosmos_mutate(space, remove_archived, "archive_settled_reservations", "Error archiving settled reservations.")
+
+        archived += sum(len(x) for x in expired.values())
+
+    if archived:
+        logger.info("Archived {} settled reservation(s).".format(archived))
@@ -0,0 +1,390 @@
+import bisect
+from collections import OrderedDict
+from netaddr import IPNetwork, IPAddress
+
+from app.routers.common.prefix import parse_prefix
+
+def cidr_interval(cidr):
+    """Return the (first, last, version) integer span covered by a CIDR."""
+
+    if isinstance(cidr, IPNetwork):
+        return (cidr.first, cidr.last, cidr.version)
+
+    first, last, _, version = parse_prefix(str(cidr))
+
+    return (first, last, version)
+
+def merge_intervals(intervals):
+    """Sort and coalesce overlapping or adjacent inclusive (start, end) intervals."""
+
+    merged = []
+
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    return [(start, end) for start, end in merged]
+
+def subtract_intervals(base, used):
+    """Remove the merged intervals in used from the merged intervals in base."""
+
+    free = []
+    i = 0
+
+    for start, end in base:
+        cursor = start
+
+        while i < len(used) and used[i][1] < cursor:
+            i += 1
+
+        j = i
+
+        while j < len(used) and used[j][0] <= end:
+            if used[j][0] > cursor:
+                free.append((cursor, used[j][0] - 1))
+
+            cursor = max(cursor, used[j][1] + 1)
+            j += 1
+
+        if cursor <= end:
+            free.append((cursor, end))
+
+    return free
+
+def interval_blocks(start, end, bits):
+    """Split an inclusive interval into its maximal aligned (start, prefixlen) blocks, lowest first."""
+
+    blocks = []
+
+    while start <= end:
+        span = (start & -start) if start else (1 << bits)
+
+        while span > (end - start + 1):
+            span >>= 1
+
+        blocks.append((start, bits - span.bit_length() + 1))
+        start += span
+
+    return blocks
+
+def carve_subnet(block, size, reverse = False):
+    """
+    Return the first (or last, when reverse) /size network inside block. Same
+    result as list(block.subnet(size))[0 or -1], computed without enumerating.
+    """
+
+    bits = 32 if block.version == 4 else 128
+    span = 1 << (bits - size)
+    start = (block.last - span + 1) if reverse else block.first
+
+    return IPNetwork("{}/{}".format(IPAddress(start, block.version), size))
+
+class FreeSpace:
+    """
+    Free address space of one or more parent CIDRs minus a set of used CIDRs,
+    held as sorted integer (start, end) intervals. Iterating the free space
+    yields the same aligned CIDRs, in the same order, as
+    (IPSet(parents) ^ IPSet(used)).iter_cidrs() without building that list.
+    """
+
+    def __init__(self, parents, used = ()):
+        parent_spans = [cidr_interval(x) for x in parents]
+        used_spans = [cidr_interval(x) for x in used]
+
+        self.version = parent_spans[0][2] if parent_spans else 4
+        self.bits = 32 if self.version == 4 else 128
+
+        base = merge_intervals([(s, e) for s, e, _ in parent_spans])
+        taken = merge_intervals([(s, e) for s, e, v in used_spans if v == self.version])
+
+        self.intervals = subtract_intervals(base, taken)
+
+    def __contains__(self, cidr):
+        """True if every address in cidr is free."""
+
+        start, end, version = cidr_interval(cidr)
+
+        if version != self.version:
+            return False
+
+        lo, hi = 0, len(self.intervals)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self.intervals[mid][1] < start:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo < len(self.intervals) and self.intervals[lo][0] <= start and end <= self.intervals[lo][1]
+
+    def reserve(self, cidr):
+        """Remove cidr from the free space."""
+
+        start, end, version = cidr_interval(cidr)
+
+        if version == self.version:
+            self.intervals = subtract_intervals(self.intervals, [(start, end)])
+
+    def iter_blocks(self, reverse = False):
+        """Yield free aligned (start, prefixlen) blocks in address order, or reversed."""
+
+        intervals = reversed(self.intervals) if reverse else self.intervals
+
+        for start, end in intervals:
+            blocks = interval_blocks(start, end, self.bits)
+
+            yield from (reversed(blocks) if reverse else blocks)
+
+    def to_network(self, start, prefixlen):
+        return IPNetwork("{}/{}".format(IPAddress(start, self.version), prefixlen))
+
+    def find_block(self, size, reverse = False, smallest = False):
+        """
+        Return the free CIDR (as an IPNetwork) a /size network would be carved from,
+        or None. By default this is the first block large enough in search order;
+        with smallest=True it is the first of the smallest blocks large enough.
+        """
+
+        best = None
+
+        for start, prefixlen in self.iter_blocks(reverse):
+            if prefixlen > size:
+                continue
+
+            if not smallest:
+                return self.to_network(start, prefixlen)
+
+            if best is None or prefixlen > best[1]:
+                best = (start, prefixlen)
+
+                if prefixlen == size:
+                    break
+
+        return self.to_network(*best) if best else None
+
+class BuddyAllocator:
+    """
+    Power-of-two free lists (one sorted list of block starts per prefix length)
+    for a single parent CIDR. Finding the smallest free block that can hold a
+    /size network takes at most one list lookup per prefix length.
+    """
+
+    def __init__(self, parent, used = ()):
+        self.parent = parent
+        self.used = set()
+        self.rebuild(used)
+
+    def rebuild(self, used):
+        """Recompute the free lists from scratch."""
+
+        free_space = FreeSpace([self.parent], used)
+
+        self.version = free_space.version
+        self.bits = free_space.bits
+        self.free = {}
+
+        for start, prefixlen in free_space.iter_blocks():
+            self.free.setdefault(prefixlen, []).append(start)
+
+        self.used = set(used)
+
+    def sync(self, used):
+        """
+        Bring the free lists in line with the current used CIDRs. Newly used
+        CIDRs are carved out in place; anything released forces a rebuild.
+        """
+
+        used = set(used)
+
+        if not (self.used - used):
+            for cidr in (used - self.used):
+                self.reserve(cidr)
+
+            self.used = used
+        else:
+            self.rebuild(used)
+
+    def reserve(self, cidr):
+        """Remove cidr from the free lists, splitting any free block that contains it."""
+
+        start, end, version = cidr_interval(cidr)
+
+        if version != self.version:
+            return
+
+        overlapping = []
+
+        for prefixlen, starts in self.free.items():
+            span = 1 << (self.bits - prefixlen)
+            lo = bisect.bisect_left(starts, start - span + 1)
+            hi = bisect.bisect_right(starts, end)
+
+            overlapping += [(block_start, prefixlen) for block_start in starts[lo:hi]]
+
+        for block_start, prefixlen in overlapping:
+            block_end = block_start + (1 << (self.bits - prefixlen)) - 1
+
+            self.free[prefixlen].remove(block_start)
+
+            if block_start < start:
+                self.add_interval(block_start, start - 1)
+
+            if block_end > end:
+                self.add_interval(end + 1, block_end)
+
+    def add_interval(self, start, end):
+        for block_start, prefixlen in interval_blocks(start, end, self.bits):
+            bisect.insort(self.free.setdefault(prefixlen, []), block_start)
+
+    def find_block(self, size, reverse = False):
+        """
+        Return the smallest free CIDR (as an IPNetwork) able to hold a /size network,
+        lowest address first (highest when reverse), or None.
+        """
+
+        for prefixlen in range(size, -1, -1):
+            starts = self.free.get(prefixlen)
+
+            if starts:
+                start = starts[-1] if reverse else starts[0]
+
+                return IPNetwork("{}/{}".format(IPAddress(start, self.version), prefixlen))
+
+        return None
+
+class BuddyCache:
+    """Bounded LRU of BuddyAllocator instances keyed by block."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, parent, used):
+        """Return the allocator for key, synced to the given parent and used CIDRs."""
+
+        allocator = self._data.get(key)
+
+        if allocator is None or allocator.parent != parent:
+            self.misses += 1
+            allocator = BuddyAllocator(parent, used)
+            self._data[key] = allocator
+        else:
+            self.hits += 1
+            allocator.sync(used)
+
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+        return allocator
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+def host_range(cidr):
+    """
+    Return the (first, last) integer host addresses of cidr, matching
+    IPNetwork.iter_hosts(): the network address (and the IPv4 broadcast address)
+    are excluded unless the prefix is /31 or /32 (/127 or /128 for IPv6).
+    """
+
+    network = cidr if isinstance(cidr, IPNetwork) else IPNetwork(cidr)
+    bits = 32 if network.version == 4 else 128
+
+    if network.prefixlen >= bits - 1:
+        return (network.first, network.last)
+
+    if network.version == 4:
+        return (network.first + 1, network.last - 1)
+
+    return (network.first + 1, network.last)
+
+class HostBitmap:
+    """
+    One bit per assignable host address of a subnet. Marking an address and
+    checking for duplicates are O(1); next_free() resumes scanning from the
+    last assignment, so filling n addresses in bulk is a single pass.
+    """
+
+    def __init__(self, cidr):
+        self.network = cidr if isinstance(cidr, IPNetwork) else IPNetwork(cidr)
+        self.first, self.last = host_range(self.network)
+        self.count = self.last - self.first + 1
+        self.bitmap = bytearray((self.count + 7) // 8)
+        self.outside = set()
+        self.cursor = 0
+
+    def __contains__(self, ip):
+        """True if ip has already been marked."""
+
+        addr = int(IPAddress(ip))
+
+        if self.first <= addr <= self.last:
+            offset = addr - self.first
+
+            return bool(self.bitmap[offset >> 3] & (1 << (offset & 7)))
+
+        return addr in self.outside
+
+    def mark(self, ip):
+        """Mark ip as used. Returns False if it was already marked."""
+
+        addr = int(IPAddress(ip))
+
+        if not (self.first <= addr <= self.last):
+            if addr in self.outside:
+                return False
+
+            self.outside.add(addr)
+
+            return True
+
+        offset = addr - self.first
+        bit = 1 << (offset & 7)
+
+        if self.bitmap[offset >> 3] & bit:
+            return False
+
+        self.bitmap[offset >> 3] |= bit
+
+        return True
+
+    def next_free(self):
+        """Mark and return the lowest unmarked host address at or after the cursor, or None."""
+
+        index = self.cursor >> 3
+
+        while index < len(self.bitmap):
+            byte = self.bitmap[index]
+
+            if byte != 0xFF:
+                for bit in range(8):
+                    offset = (index << 3) + bit
+
+                    if offset >= self.count:
+                        return None
+
+                    if offset >= self.cursor and not byte & (1 << bit):
+                        self.bitmap[index] |= (1 << bit)
+                        self.cursor = offset + 1
+
+                        return IPAddress(self.first + offset, self.network.version)
+
+            index += 1
+
+        return None
+
+buddy_cache = BuddyCache(256)
@@ -0,0 +1,293 @@
+import copy
+import time
+import asyncio
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Size-bounded, in-process LRU cache whose entries expire after a fixed TTL.
+    Expired entries are kept for up to max_stale seconds so callers can serve
+    them while a refresh is in progress. A TTL or size of zero disables the cache.
+    """
+
+    def __init__(self, ttl, maxsize, max_stale = 0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_stale = max(max_stale, ttl)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get_entry(self, key):
+        """Return (value, age) for key while within max_stale, otherwise None."""
+
+        entry = self._data.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        created, value = entry
+        age = time.monotonic() - created
+
+        if age >= self.max_stale:
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+
+        if age >= self.ttl:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+
+        return (value, age)
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+
+        entry = self._data.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        created, value = entry
+
+        if (time.monotonic() - created) >= self.ttl:
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entries when full."""
+
+        if not self.enabled:
+            return
+
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, match=None):
+        """Drop every entry, or only the entries whose key satisfies match(key)."""
+
+        if match is None:
+            self._data.clear()
+            return
+
+        for key in [k for k in self._data if match(k)]:
+            del self._data[key]
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "max_stale": self.max_stale,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses
+        }
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single in-flight task.
+    Every caller receives its own deep copy of the shared result.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    async def run(self, key, func, *args):
+        """Await func(*args), or join the call already in flight for key."""
+
+        flight = self._flights.get(key)
+
+        if flight is None:
+            self.misses += 1
+
+            flight = {
+                "task": asyncio.ensure_future(func(*args)),
+                "shared": False
+            }
+
+            self._flights[key] = flight
+            flight['task'].add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.hits += 1
+
+            if not flight['shared']:
+                flight['shared'] = True
+                self.coalesced += 1
+
+        result = await asyncio.shield(flight['task'])
+
+        return copy.deepcopy(result)
+
+    def stats(self):
+        return {
+            "inflight": len(self._flights),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced
+        }
+
+class CredentialPool:
+    """
+    Keeps credential objects alive across requests so their token caches are
+    reused. Entries are dropped once past their expiry, or in least recently
+    used order when the pool is full. Requests may still be using a dropped
+    credential, so it is parked on a retire list and only closed after grace
+    seconds (longer than any single request is allowed to run).
+    """
+
+    def __init__(self, maxsize, grace = 600):
+        self.maxsize = maxsize
+        self.grace = grace
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._retired = []
+
+    async def get(self, key, factory, expires_on = float('inf')):
+        """Return the pooled credential for key, creating it with factory() if needed."""
+
+        now = time.time()
+        retired = [k for k, (expiry, _) in self._data.items() if expiry <= now]
+        retired_creds = [self._data.pop(k)[1] for k in retired]
+
+        entry = self._data.get(key)
+
+        if entry is not None:
+            self._data.move_to_end(key)
+            self.hits += 1
+            credential = entry[1]
+        else:
+            self.misses += 1
+            credential = factory()
+            self._data[key] = (expires_on, credential)
+
+            while len(self._data) > max(self.maxsize, 1):
+                retired_creds.append(self._data.popitem(last=False)[1][1])
+
+        self.evictions += len(retired_creds)
+        self._retired += [(now, retired_cred) for retired_cred in retired_creds]
+
+        await self.close_retired(now)
+
+        return credential
+
+    async def close_retired(self, now = None):
+        """Close retired credentials whose grace period has passed."""
+
+        cutoff = (now or time.time()) - self.grace
+
+        expired = [credential for retired_on, credential in self._retired if retired_on <= cutoff]
+        self._retired = [x for x in self._retired if x[0] > cutoff]
+
+        for credential in expired:
+            await credential.close()
+
+    async def close(self):
+        """Close and drop every pooled and retired credential."""
+
+        credentials = [credential for _, credential in self._data.values()]
+        credentials += [credential for _, credential in self._retired]
+
+        self._data.clear()
+        self._retired = []
+
+        for credential in credentials:
+            await credential.close()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "retired": len(self._retired),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+class TokenCache:
+    """
+    Bounded LRU of verified token payloads. Each entry expires at its own
+    absolute epoch timestamp (the token's exp claim). Tracks how much
+    verification time cache hits have avoided.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.verify_time = 0.0
+        self.verify_count = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """Return the payload for key if present and not yet expired."""
+
+        entry = self._data.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_on, value = entry
+
+        if expires_on <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def set(self, key, value, expires_on, verify_time = 0.0):
+        """Store a verified payload and record how long its verification took."""
+
+        self.verify_time += verify_time
+        self.verify_count += 1
+
+        if self.maxsize <= 0:
+            return
+
+        self._data[key] = (expires_on, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        avg_verify = (self.verify_time / self.verify_count) if self.verify_count else 0.0
+
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "avg_verify_ms": avg_verify * 1000,
+            "verify_ms_saved": self.hits * avg_verify * 1000
+        }
@@ -0,0 +1,93 @@
+import asyncio
+
+class WriteCombiner:
+    """
+    Per-key queue of pending document mutations. The first caller for a key
+    starts a flush loop which waits window seconds, hands up to max_batch queued
+    mutations to commit(item, mutations) as one write and resolves every
+    caller's future with its own outcome. Mutations queued while a write is in
+    flight go out together in the next batch, so a hot key is written by one
+    replace at a time instead of many racing on the same etag.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = {}
+        self.tasks = {}
+        self.batches = 0
+        self.mutations = 0
+        self.largest = 0
+
+    async def submit(self, key, item, mutation, commit):
+        """Queue mutation against item under key and wait for its outcome."""
+
+        future = asyncio.get_running_loop().create_future()
+
+        self.pending.setdefault(key, []).append((item, mutation, future))
+
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self.flush(key, commit))
+
+        return await future
+
+    async def flush(self, key, commit):
+        batch = []
+
+        try:
+            while self.pending.get(key):
+                await asyncio.sleep(self.window)
+
+                batch = self.pending[key][:self.max_batch]
+                self.pending[key] = self.pending[key][self.max_batch:]
+
+                self.batches += 1
+                self.mutations += len(batch)
+                self.largest = max(self.largest, len(batch))
+
+                try:
+                    outcomes = await commit(batch[0][0], [entry[1] for entry in batch])
+                except Exception as e:
+                    self.fail(batch, e)
+                    batch = []
+
+                    continue
+
+                for (_, _, future), outcome in zip(batch, outcomes or [None] * len(batch)):
+                    if not future.done():
+                        future.set_result(outcome)
+
+                batch = []
+        except BaseException as e:
+            self.fail(batch + self.pending.pop(key, []), e)
+
+            raise
+        finally:
+            if not self.pending.get(key):
+                self.pending.pop(key, None)
+
+            self.tasks.pop(key, None)
+
+    def fail(self, entries, error):
+        for _, _, future in entries:
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self):
+        """Cancel every flush loop, failing the mutations still waiting on them."""
+
+        tasks = list(self.tasks.values())
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+    def stats(self):
+        return {
+            "keys": len(self.tasks),
+            "batches": self.batches,
+            "mutations": self.mutations,
+            "largest_batch": self.largest,
+            "avg_batch": round(self.mutations / self.batches, 2) if self.batches else 0
+        }
@@ -13,11 +13,51 @@ from azure.cosmos.aio import CosmosClient
 import azure.cosmos.exceptions as exceptions
 
 import jwt
+import copy
+import time
+import uuid
+import random
+import asyncio
+import hashlib
 from netaddr import IPNetwork
 from functools import wraps
 
+from app.routers.common.cache import TTLCache, SingleFlight, CredentialPool
+from app.routers.common.mirror import CosmosMirror
+from app.routers.common.combiner import WriteCombiner
+from app.routers.common.layout import SPLIT_TYPES, TornSpaceRead, is_split, split_space, assemble_space, diff_space, move_generation, new_generation
+
 from app.globals import globals
 
+arg_flight = SingleFlight()
+credential_pool = CredentialPool(globals.CREDENTIAL_POOL_SIZE)
+
+admin_cache = TTLCache(
+    ttl = globals.ADMIN_CACHE_TTL,
+    maxsize = globals.ADMIN_CACHE_SIZE,
+    max_stale = globals.ADMIN_CACHE_TTL * 10
+)
+admin_flight = SingleFlight()
+
+space_ids = {}
+
+SPLIT_BATCH_SIZE = 100
+SPLIT_READ_RETRY = 3
+
+SPLIT_PARTS_QUERY = "SELECT * FROM c WHERE c.space_id = @space_id AND c.type IN ('block', 'external', 'reservation')"
+
+cosmos_conflicts = {}
+
+write_combiner = WriteCombiner(
+    window = globals.WRITE_COMBINE_WINDOW / 1000,
+    max_batch = globals.WRITE_COMBINE_MAX_BATCH
+)
+
+cosmos_mirror = CosmosMirror(
+    poll_interval = globals.COSMOS_MIRROR_INTERVAL,
+    reload_interval = globals.COSMOS_MIRROR_RELOAD
+)
+
 managed_identity_credential = ManagedIdentityCredential(
     client_id = globals.MANAGED_IDENTITY_ID
 )
@@ -99,6 +139,16 @@ def get_user_id_from_jwt(token):
 
     return decoded['oid']
 
+def get_credential_scope(auth, admin):
+    """DOCSTRING"""
+
+    if admin:
+        return (globals.TENANT_ID, "admin")
+
+    user_assertion=auth.split(' ')[1]
+
+    return (get_tenant_from_jwt(user_assertion), get_user_id_from_jwt(user_assertion))
+
 async def get_obo_token(assertion):
     """DOCSTRING"""
 
@@ -118,11 +168,14 @@ async def get_obo_token(assertion):
 async def get_client_credentials():
     """DOCSTRING"""
 
-    credential = ClientSecretCredential(
-        tenant_id=globals.TENANT_ID,
-        client_id=globals.CLIENT_ID,
-        client_secret=globals.CLIENT_SECRET,
-        authority=globals.AUTHORITY_HOST
+    credential = await credential_pool.get(
+        "client",
+        lambda: ClientSecretCredential(
+            tenant_id=globals.TENANT_ID,
+            client_id=globals.CLIENT_ID,
+            client_secret=globals.CLIENT_SECRET,
+            authority=globals.AUTHORITY_HOST
+        )
     )
 
     return credential
@@ -130,16 +183,33 @@ async def get_client_credentials():
 async def get_obo_credentials(assertion):
     """DOCSTRING"""
 
-    credential = OnBehalfOfCredential(
-        tenant_id=globals.TENANT_ID,
-        client_id=globals.CLIENT_ID,
-        client_secret=globals.CLIENT_SECRET,
-        user_assertion=assertion,
-        authority=globals.AUTHORITY_HOST
+    assertion_hash = hashlib.sha256(assertion.encode()).hexdigest()
+    decoded = jwt.decode(assertion, options={"verify_signature": False})
+
+    credential = await credential_pool.get(
+        ("obo", assertion_hash),
+        lambda: OnBehalfOfCredential(
+            tenant_id=globals.TENANT_ID,
+            client_id=globals.CLIENT_ID,
+            client_secret=globals.CLIENT_SECRET,
+            user_assertion=assertion,
+            authority=globals.AUTHORITY_HOST
+        ),
+        decoded.get('exp', 0)
     )
 
     return credential
 
+async def close_credentials():
+    """DOCSTRING"""
+
+    await credential_pool.close()
+
+async def close_write_combiner():
+    """DOCSTRING"""
+
+    await write_combiner.close()
+
 async def get_mgmt_group_name(tenant_id):
     """DOCSTRING"""
 
@@ -152,12 +222,11 @@ async def get_mgmt_group_name(tenant_id):
         raise HTTPException(status_code=500, detail="Error fetching management group name.")
     finally:
         await mgmt_group_api.close()
-        await client_creds.close()
 
     return result
 
 # Needs a try/except block for aiohttp.client_exceptions.ServerTimeoutError
-async def cosmos_query(query: str, tenant_id: str):
+async def cosmos_query(query: str, tenant_id: str, parameters: list = None):
     """DOCSTRING"""
 
     # cosmos_client = CosmosClient(globals.COSMOS_URL, credential=globals.COSMOS_KEY)
@@ -170,6 +239,7 @@ async def cosmos_query(query: str, tenant_id: str):
 
     query_results = container.query_items(
         query = query,
+        parameters = parameters,
         # enable_cross_partition_query=True,
         partition_key = tenant_id
     )
@@ -180,6 +250,65 @@ async def cosmos_query(query: str, tenant_id: str):
 
     return result_array
 
+async def cosmos_read(item_id: str, tenant_id: str):
+    """DOCSTRING"""
+
+    database_name = globals.DATABASE_NAME
+    database = cosmos_client.get_database_client(database_name)
+
+    container_name = globals.CONTAINER_NAME
+    container = database.get_container_client(container_name)
+
+    try:
+        item = await container.read_item(
+            item = item_id,
+            partition_key = tenant_id
+        )
+    except exceptions.CosmosResourceNotFoundError:
+        if globals.COSMOS_MIRROR:
+            cosmos_mirror.remove(tenant_id, item_id)
+
+        return None
+
+    if item.get('type') == 'space' and is_split(item):
+        item = await cosmos_read_split(item)
+
+    return item
+
+async def cosmos_read_split(root, parts = None):
+    """
+    Assemble a split space from its root and parts, querying the parts when not
+    given. If a write removed referenced parts between the two reads, the root
+    and its parts are read again. Returns None if the space was deleted.
+    """
+
+    database_name = globals.DATABASE_NAME
+    database = cosmos_client.get_database_client(database_name)
+
+    container_name = globals.CONTAINER_NAME
+    container = database.get_container_client(container_name)
+
+    for attempt in range(SPLIT_READ_RETRY):
+        if parts is None:
+            parts = await cosmos_query(SPLIT_PARTS_QUERY, root['tenant_id'], [{"name": "@space_id", "value": root['id']}])
+
+        try:
+            return assemble_space(root, parts)
+        except TornSpaceRead:
+            pass
+
+        try:
+            root = await container.read_item(
+                item = root['id'],
+                partition_key = root['tenant_id']
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+        parts = None
+
+    raise HTTPException(status_code=500, detail="Error reading space, please try again.")
+
 async def cosmos_upsert(data):
     """DOCSTRING"""
 
@@ -191,6 +320,9 @@ async def cosmos_upsert(data):
     container_name = globals.CONTAINER_NAME
     container = database.get_container_client(container_name)
 
+    if data.get('type') == 'space' and is_split(data):
+        return await cosmos_write_split(container, None, data)
+
     try:
         res = await container.upsert_item(data)
     except:
@@ -200,6 +332,9 @@ async def cosmos_upsert(data):
 
     # await cosmos_client.close()
 
+    if globals.COSMOS_MIRROR:
+        cosmos_mirror.invalidate(data['tenant_id'])
+
     return res
 
 async def cosmos_replace(old, new):
@@ -213,15 +348,26 @@ async def cosmos_replace(old, new):
     container_name = globals.CONTAINER_NAME
     container = database.get_container_client(container_name)
 
+    if new.get('type') == 'space' and is_split(new):
+        await cosmos_write_split(container, old, new)
+
+        return
+
     try:
-        await container.replace_item(
+        res = await container.replace_item(
             item = old,
             body = new,
             match_condition = MatchConditions.IfNotModified,
             etag = old['_etag']
         )
-    except:
+    except exceptions.CosmosAccessConditionFailedError:
+        if globals.COSMOS_MIRROR:
+            cosmos_mirror.invalidate(old['tenant_id'])
+
         raise
+
+    if globals.COSMOS_MIRROR:
+        cosmos_mirror.invalidate(new['tenant_id'])
     # finally:
     #     await cosmos_client.close()
 
@@ -229,6 +375,19 @@ async def cosmos_replace(old, new):
 
     return
 
+def tombstone(item_id, tenant_id: str):
+    """
+    Short-lived document replacing a deleted item, so the delete shows up in the
+    change feed and other instances drop the item from their mirror.
+    """
+
+    return {
+        "id": item_id,
+        "type": "tombstone",
+        "tenant_id": tenant_id,
+        "ttl": globals.COSMOS_TOMBSTONE_TTL
+    }
+
 async def cosmos_delete(item, tenant_id: str):
     """DOCSTRING"""
 
@@ -240,13 +399,14 @@ async def cosmos_delete(item, tenant_id: str):
     container_name = globals.CONTAINER_NAME
     container = database.get_container_client(container_name)
 
-    try:
-        await container.delete_item(
-            item = item,
-            partition_key = tenant_id
-        )
-    except:
-        raise
+    item_id = item['id'] if isinstance(item, dict) else item
+
+    await cosmos_delete_ids(container, [item_id], tenant_id)
+
+    if isinstance(item, dict) and item.get('type') == 'space' and is_split(item):
+        parts = await cosmos_query(SPLIT_PARTS_QUERY, tenant_id, [{"name": "@space_id", "value": item_id}])
+
+        await cosmos_delete_ids(container, [part['id'] for part in parts], tenant_id)
     # finally:
     #     await cosmos_client.close()
 
@@ -254,6 +414,355 @@ async def cosmos_delete(item, tenant_id: str):
 
     return
 
+async def cosmos_delete_ids(container, item_ids, tenant_id: str):
+    """
+    Delete items one by one, replacing them with tombstones when the mirror is
+    enabled. Items that are already gone are skipped, so an interrupted delete
+    can simply be run again.
+    """
+
+    for item_id in item_ids:
+        if globals.COSMOS_MIRROR:
+            await container.upsert_item(tombstone(item_id, tenant_id))
+
+            cosmos_mirror.invalidate(tenant_id)
+
+            continue
+
+        try:
+            await container.delete_item(
+                item = item_id,
+                partition_key = tenant_id
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+async def cosmos_split_batch(container, root, operations):
+    """Run one transactional batch for a split space, reporting a root etag mismatch as CosmosAccessConditionFailedError."""
+
+    try:
+        results = await container.execute_item_batch(
+            batch_operations = operations,
+            partition_key = root['tenant_id']
+        )
+    except exceptions.CosmosBatchOperationError as e:
+        failed = e.operation_responses[e.error_index] if e.operation_responses else {}
+
+        if failed.get('statusCode') == 412:
+            if globals.COSMOS_MIRROR:
+                cosmos_mirror.invalidate(root['tenant_id'])
+
+            raise exceptions.CosmosAccessConditionFailedError(status_code = 412, message = "Space document was modified by another writer.")
+
+        raise
+
+    if globals.COSMOS_MIRROR:
+        cosmos_mirror.invalidate(root['tenant_id'])
+
+    return results
+
+async def cosmos_write_split(container, old, new):
+    """
+    Write a space stored in the split layout. When the change fits in one
+    transactional batch, the root document is replaced under the etag of old
+    (or upserted when old is None) together with only the part documents that
+    changed. Larger changes are staged as a complete new generation of parts,
+    which readers ignore until the root is switched to that generation under
+    the same etag check. The generation just replaced is kept for readers that
+    still hold its root, and older ones are deleted.
+    """
+
+    root, parts, changed, removed = diff_space(old, new)
+    tenant_id = new['tenant_id']
+
+    def root_op(root):
+        if old is not None and '_etag' in old:
+            return ("replace", (root['id'], root), {"if_match_etag": old['_etag']})
+
+        return ("upsert", (root,))
+
+    if (len(changed) + len(removed)) < SPLIT_BATCH_SIZE:
+        if globals.COSMOS_MIRROR:
+            delete_ops = [("upsert", (tombstone(part_id, tenant_id),)) for part_id in removed]
+        else:
+            delete_ops = [("delete", (part_id,)) for part_id in removed]
+
+        operations = [root_op(root)] + [("upsert", (part,)) for part in changed] + delete_ops
+        results = await cosmos_split_batch(container, root, operations)
+    else:
+        root, parts = move_generation(root, parts, new_generation())
+
+        try:
+            for i in range(0, len(parts), SPLIT_BATCH_SIZE):
+                await cosmos_split_batch(container, root, [("upsert", (part,)) for part in parts[i:i + SPLIT_BATCH_SIZE]])
+
+            results = await cosmos_split_batch(container, root, [root_op(root)])
+        except Exception:
+            try:
+                await cosmos_delete_ids(container, [part['id'] for part in parts], tenant_id)
+            except Exception:
+                pass
+
+            raise
+
+        # Keep the generation just replaced for readers still holding its root
+        previous = old['gen'] if (old and is_split(old)) else root['gen']
+
+        stale = await cosmos_query(
+            SPLIT_PARTS_QUERY + " AND c.gen != @gen AND c.gen != @previous",
+            tenant_id,
+            [{"name": "@space_id", "value": root['id']}, {"name": "@gen", "value": root['gen']}, {"name": "@previous", "value": previous}]
+        )
+
+        await cosmos_delete_ids(container, [part['id'] for part in stale], tenant_id)
+
+    root_result = results[0].get('resourceBody') or root
+
+    return assemble_space(root_result, parts)
+
+async def sync_cosmos_mirror():
+    """DOCSTRING"""
+
+    database_name = globals.DATABASE_NAME
+    database = cosmos_client.get_database_client(database_name)
+
+    container_name = globals.CONTAINER_NAME
+    container = database.get_container_client(container_name)
+
+    await cosmos_mirror.sync(container)
+
+async def get_space_docs(tenant_id: str, space: str = None):
+    """DOCSTRING"""
+
+    if globals.COSMOS_MIRROR and cosmos_mirror.current(tenant_id):
+        match = (lambda x: x['name'].lower() == space.lower()) if space is not None else None
+
+        spaces = cosmos_mirror.find(tenant_id, 'space', match)
+
+        for i, item in enumerate(spaces):
+            if is_split(item):
+                parts = cosmos_mirror.find(tenant_id, SPLIT_TYPES, lambda x: x['space_id'] == item['id'])
+
+                try:
+                    spaces[i] = assemble_space(item, parts)
+                except TornSpaceRead:
+                    spaces[i] = await cosmos_read_split(item)
+
+        return [x for x in spaces if x is not None]
+
+    if space is None:
+        spaces = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", tenant_id)
+
+        for item in spaces:
+            space_ids[(tenant_id, item['name'].lower())] = item['id']
+
+        if any(is_split(item) for item in spaces):
+            parts = await cosmos_query("SELECT * FROM c WHERE c.type IN ('block', 'external', 'reservation')", tenant_id)
+            space_parts = {}
+
+            for part in parts:
+                space_parts.setdefault(part['space_id'], []).append(part)
+
+            spaces = [(await cosmos_read_split(item, space_parts.get(item['id'], []))) if is_split(item) else item for item in spaces]
+            spaces = [x for x in spaces if x is not None]
+
+        return spaces
+
+    space_key = (tenant_id, space.lower())
+    space_id = space_ids.get(space_key)
+
+    if space_id:
+        item = await cosmos_read(space_id, tenant_id)
+
+        if item and item['type'] == 'space' and item['name'].lower() == space_key[1]:
+            return [item]
+
+        space_ids.pop(space_key, None)
+
+    spaces = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = @space", tenant_id, [{"name": "@space", "value": space_key[1]}])
+
+    if spaces:
+        space_ids[space_key] = spaces[0]['id']
+
+        if is_split(spaces[0]):
+            item = await cosmos_read_split(spaces[0])
+            spaces = [item] if item else []
+
+    return spaces
+
+def archive_doc_id(space_id, resv_id):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "{}/archive/{}".format(space_id, resv_id)))
+
+async def get_archived_reservations(tenant_id: str, space_id: str, block: str = None, resv_id: str = None):
+    """DOCSTRING"""
+
+    query = "SELECT * FROM c WHERE c.type = 'resv_archive' AND c.space_id = @space_id"
+    parameters = [{"name": "@space_id", "value": space_id}]
+
+    if block is not None:
+        query += " AND LOWER(c.block) = @block"
+        parameters.append({"name": "@block", "value": block.lower()})
+
+    if resv_id is not None:
+        query += " AND c.reservation.id = @resv_id"
+        parameters.append({"name": "@resv_id", "value": resv_id})
+
+    return await cosmos_query(query, tenant_id, parameters)
+
+async def archive_reservations(space, block_name, reservations):
+    """
+    Copy settled reservations of a block into append-only 'resv_archive' items.
+    Archive ids are derived from the reservation id, so re-archiving after an
+    interrupted run overwrites the same items instead of duplicating them.
+    """
+
+    for resv in reservations:
+        archive_item = {
+            "id": archive_doc_id(space['id'], resv['id']),
+            "type": "resv_archive",
+            "tenant_id": space['tenant_id'],
+            "space_id": space['id'],
+            "space": space['name'],
+            "block": block_name,
+            "archivedOn": time.time(),
+            "reservation": resv
+        }
+
+        if globals.RESV_ARCHIVE_TTL > 0:
+            archive_item['ttl'] = globals.RESV_ARCHIVE_TTL
+
+        await cosmos_upsert(archive_item)
+
+async def rename_archived_reservations(tenant_id: str, space_id: str, old_name: str, new_name: str):
+    """Move the archived reservations of a renamed block over to its new name."""
+
+    archived = await get_archived_reservations(tenant_id, space_id, old_name)
+
+    for archive_item in archived:
+        archive_item['block'] = new_name
+
+        await cosmos_upsert(archive_item)
+
+async def get_user_docs(tenant_id: str, user_id: str = None):
+    """DOCSTRING"""
+
+    if globals.COSMOS_MIRROR and cosmos_mirror.current(tenant_id):
+        match = (lambda x: x['data']['id'] == user_id) if user_id is not None else None
+
+        return cosmos_mirror.find(tenant_id, 'user', match)
+
+    if user_id is not None:
+        return await cosmos_query("SELECT * FROM c WHERE (c.type = 'user' AND c['data']['id'] = @user_id)", tenant_id, [{"name": "@user_id", "value": user_id}])
+
+    return await cosmos_query("SELECT * FROM c WHERE c.type = 'user'", tenant_id)
+
+async def cosmos_read_if_modified(item_id, tenant_id: str, etag: str):
+    """DOCSTRING"""
+
+    database_name = globals.DATABASE_NAME
+    database = cosmos_client.get_database_client(database_name)
+
+    container_name = globals.CONTAINER_NAME
+    container = database.get_container_client(container_name)
+
+    try:
+        item = await container.read_item(
+            item = item_id,
+            partition_key = tenant_id,
+            match_condition = MatchConditions.IfModified,
+            etag = etag
+        )
+    except exceptions.CosmosHttpResponseError as e:
+        if e.status_code == 304:
+            return None
+
+        raise
+
+    if not item or item.get('_etag') == etag:
+        return None
+
+    return item
+
+def build_admin_entry(admin_doc):
+    """DOCSTRING"""
+
+    return {
+        "doc": admin_doc,
+        "admins": {x['id'] for x in admin_doc['admins']} if admin_doc else set(),
+        "exclusions": list(admin_doc['exclusions']) if admin_doc else []
+    }
+
+async def fetch_admin_entry(tenant_id, cached_entry):
+    """DOCSTRING"""
+
+    if globals.COSMOS_MIRROR and cosmos_mirror.current(tenant_id):
+        admin_docs = cosmos_mirror.find(tenant_id, 'admin')
+        admin_entry = build_admin_entry(admin_docs[0] if admin_docs else None)
+
+        admin_cache.set(tenant_id, admin_entry)
+
+        return admin_entry
+
+    cached_doc = cached_entry['doc'] if cached_entry else None
+
+    if cached_doc:
+        try:
+            updated_doc = await cosmos_read_if_modified(cached_doc['id'], tenant_id, cached_doc['_etag'])
+        except exceptions.CosmosResourceNotFoundError:
+            if globals.COSMOS_MIRROR:
+                cosmos_mirror.remove(tenant_id, cached_doc['id'])
+
+            updated_doc = None
+            cached_doc = None
+
+        if cached_doc and not updated_doc:
+            admin_cache.set(tenant_id, cached_entry)
+
+            return cached_entry
+
+        if updated_doc:
+            admin_entry = build_admin_entry(updated_doc)
+            admin_cache.set(tenant_id, admin_entry)
+
+            return admin_entry
+
+    admin_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'admin'", tenant_id)
+    admin_entry = build_admin_entry(admin_query[0] if admin_query else None)
+
+    admin_cache.set(tenant_id, admin_entry)
+
+    return admin_entry
+
+async def get_admin_entry(tenant_id):
+    """DOCSTRING"""
+
+    cached = admin_cache.get_entry(tenant_id)
+
+    if cached is not None:
+        admin_entry, age = cached
+
+        if age < admin_cache.ttl:
+            return admin_entry
+    else:
+        admin_entry = None
+
+    return await admin_flight.run(tenant_id, fetch_admin_entry, tenant_id, admin_entry)
+
+def invalidate_admin_cache(tenant_id):
+    """DOCSTRING"""
+
+    admin_cache.invalidate(lambda key: key == tenant_id)
+
+def record_cosmos_conflict(name):
+    """Count an etag conflict against the named endpoint."""
+
+    cosmos_conflicts[name] = cosmos_conflicts.get(name, 0) + 1
+
+def cosmos_retry_delay(attempt, base = 0.025, cap = 1.0):
+    """Full-jitter exponential backoff (in seconds) before the given retry attempt."""
+
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
 def cosmos_retry(error_msg, max_retry = 5):
     """DOCSTRING"""
 
@@ -266,78 +775,156 @@ def cosmos_retry(error_msg, max_retry = 5):
                 try:
                     return await func(*args, **kwargs)
                 except exceptions.CosmosAccessConditionFailedError:
+                    record_cosmos_conflict(func.__name__)
+
                     _tries -= 1
 
                     if _tries == 0:
                         raise HTTPException(status_code=500, detail=error_msg)
-                    
+
+                    await asyncio.sleep(cosmos_retry_delay(max_retry - _tries - 1))
+
         return func_with_retries
     return cosmos_retry_decorator
 
+def apply_mutations(doc, mutations):
+    """
+    Apply (mutation, name) pairs in order to a copy of doc. Each mutation runs on
+    its own copy, so one that raises leaves no partial change behind. Returns the
+    new doc and a (result, error) outcome per mutation.
+    """
+
+    outcomes = []
+
+    for mutation, _ in mutations:
+        attempt = copy.deepcopy(doc)
+
+        try:
+            result = mutation(attempt)
+        except Exception as e:
+            outcomes.append((None, e))
+
+            continue
+
+        doc = attempt
+        outcomes.append((result, None))
+
+    return doc, outcomes
+
+async def cosmos_mutate_batch(item, mutations, max_retry = 5):
+    """
+    Re-read item, apply mutations to it and replace it, guarded by the etag of
+    that read. On a conflict the document is re-read and the mutations
+    re-applied, after a jittered backoff. Nothing is written if the document is
+    left unchanged. Returns the outcome list from apply_mutations, or None if
+    the document is gone or every attempt conflicted.
+    """
+
+    current = await cosmos_read(item['id'], item['tenant_id'])
+
+    for attempt in range(max_retry):
+        if current is None:
+            break
+
+        target, outcomes = apply_mutations(current, mutations)
+
+        if target == current:
+            return outcomes
+
+        try:
+            await cosmos_replace(current, target)
+
+            return outcomes
+        except exceptions.CosmosAccessConditionFailedError:
+            for _, name in mutations:
+                record_cosmos_conflict(name)
+
+        if attempt < max_retry - 1:
+            await asyncio.sleep(cosmos_retry_delay(attempt))
+
+            current = await cosmos_read(current['id'], current['tenant_id'])
+
+    return None
+
+async def cosmos_mutate(item, mutation, name, error_msg):
+    """
+    Apply mutation(doc) to the stored copy of item through the write combiner,
+    which serializes and batches writes to the same document within this
+    process. mutation must only change doc; its return value is returned and
+    anything it raises is re-raised for this caller only.
+    """
+
+    key = (item['tenant_id'], item['id'])
+    outcome = await write_combiner.submit(key, item, (mutation, name), cosmos_mutate_batch)
+
+    if outcome is None:
+        raise HTTPException(status_code=500, detail=error_msg)
+
+    result, error = outcome
+
+    if error:
+        raise error
+
+    return result
+
 async def arg_query(auth, admin, query):
     """DOCSTRING"""
 
     if admin:
-        creds = await get_client_credentials()
         tenant_id = globals.TENANT_ID
     else:
         user_assertion=auth.split(' ')[1]
-        creds = await get_obo_credentials(user_assertion)
         tenant_id = get_tenant_from_jwt(user_assertion)
 
-    exclusions_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'admin'", tenant_id)
+    admin_entry = await get_admin_entry(tenant_id)
+    exclusions_array = admin_entry['exclusions']
 
-    if exclusions_query:
-        exclusions_array = exclusions_query[0]['exclusions']
-
-        if exclusions_array:
-            exclusions = "(" + str(exclusions_array)[1:-1] + ")"
-        else:
-            exclusions = "('')"
+    if exclusions_array:
+        exclusions = "(" + str(exclusions_array)[1:-1] + ")"
     else:
         exclusions = "('')"
 
+    scoped_query = query.format(exclusions)
+    flight_key = (get_credential_scope(auth, admin), scoped_query)
+
+    results = await arg_flight.run(flight_key, arg_query_scoped, auth, admin, scoped_query)
+
+    return results
+
+async def arg_query_scoped(auth, admin, query):
+    """DOCSTRING"""
+
+    if admin:
+        creds = await get_client_credentials()
+    else:
+        user_assertion=auth.split(' ')[1]
+        creds = await get_obo_credentials(user_assertion)
+
     try:
-        results = await arg_query_helper(creds, query.format(exclusions))
+        results = await arg_query_helper(creds, query)
     except ClientAuthenticationError:
         raise HTTPException(status_code=401, detail="Token has expired.")
     except HttpResponseError as e:
         print(e)
         raise HTTPException(status_code=403, detail="Access denied.")
-    finally:
-        await creds.close()
 
     return results
 
 async def arg_query_client(query):
     """DOCSTRING"""
 
-    client_creds = await get_client_credentials()
+    flight_key = (get_credential_scope(None, True), query)
 
-    try:
-        results = await arg_query_helper(client_creds, query)
-    except ClientAuthenticationError:
-        await client_creds.close()
-        raise HTTPException(status_code=401, detail="Token has expired.")
-    finally:
-        await client_creds.close()
+    results = await arg_flight.run(flight_key, arg_query_scoped, None, True, query)
 
     return results
 
 async def arg_query_obo(auth, query):
     """DOCSTRING"""
 
-    user_assertion=auth.split(' ')[1]
-
-    obo_creds = await get_obo_credentials(user_assertion)
+    flight_key = (get_credential_scope(auth, False), query)
 
-    try:
-        results = await arg_query_helper(obo_creds, query)
-    except ClientAuthenticationError:
-        await obo_creds.close()
-        raise HTTPException(status_code=401, detail="Token has expired.")
-    finally:
-        await obo_creds.close()
+    results = await arg_flight.run(flight_key, arg_query_scoped, auth, False, query)
 
     return results
 
@@ -0,0 +1,137 @@
+import copy
+from datetime import datetime, timedelta, timezone
+
+SUBNET_NAME_MAP = {
+    'AzureFirewallSubnet': 'AFW',
+    'GatewaySubnet': 'VGW',
+    'AzureBastionSubnet': 'BAS'
+}
+
+def shape_subnet(subnet):
+    """Reduce a subnet projected by argquery.VNET_SYNC to the fields returned by argquery.VNET/SUBNET."""
+
+    prefixes = subnet.get('addressPrefixes')
+
+    if prefixes is None:
+        prefixes = [subnet.get('addressPrefix')]
+
+    subnet_type = SUBNET_NAME_MAP.get(subnet.get('name'))
+
+    if subnet_type is None and subnet.get('appGateway'):
+        subnet_type = 'AGW'
+
+    return {
+        'name': subnet.get('name'),
+        'id': subnet.get('id'),
+        'prefix': prefixes,
+        'used': (subnet.get('ipConfigurations') or 0) + 5,
+        'type': subnet_type
+    }
+
+def shape_peering(peering):
+    """Reduce a raw peering object to the fields returned by argquery.VNET."""
+
+    properties = peering.get('properties') or {}
+    remote_network = properties.get('remoteVirtualNetwork') or {}
+
+    return {
+        'name': peering.get('name'),
+        'remote_network': remote_network.get('id'),
+        'state': properties.get('peeringState')
+    }
+
+def shape_vnet(row):
+    """Convert an argquery.VNET_SYNC row into a materialized vNet record."""
+
+    return {
+        'name': row['name'],
+        'id': row['id'],
+        'prefixes': row.get('prefixes') or [],
+        'subnets': [shape_subnet(subnet) for subnet in (row.get('subnets') or [])],
+        'peerings': [shape_peering(peering) for peering in (row.get('peerings') or [])],
+        'resource_group': row['resource_group'],
+        'subscription_id': row['subscription_id'],
+        'tenant_id': row['tenant_id'],
+        'resv': row.get('resv')
+    }
+
+class NetworkInventory:
+    """
+    Materialized vNet/subnet/peering table for a single credential scope. Rows are
+    keyed by lowercased vNet id so Resource Graph deltas can be applied in place.
+    """
+
+    def __init__(self):
+        self.vnets = {}
+        self.last_sync = None
+        self.last_reconcile = None
+
+    def needs_reconcile(self, interval, now = None):
+        """True when the table has never been loaded or the last full load is older than interval seconds."""
+
+        if self.last_reconcile is None:
+            return True
+
+        now = now or datetime.now(timezone.utc)
+
+        return (now - self.last_reconcile) >= timedelta(seconds=interval)
+
+    def load(self, rows, sync_time):
+        """Replace the whole table with the rows from a full scan."""
+
+        self.vnets = {row['id'].lower(): shape_vnet(row) for row in rows}
+        self.last_sync = sync_time
+        self.last_reconcile = sync_time
+
+    def apply(self, changed_ids, rows, sync_time):
+        """
+        Upsert the re-read rows for changed_ids and drop any changed vNet that
+        no longer exists. Returns the number of records touched.
+        """
+
+        current = {row['id'].lower(): row for row in rows}
+
+        for vnet_id in changed_ids:
+            if vnet_id in current:
+                self.vnets[vnet_id] = shape_vnet(current[vnet_id])
+            else:
+                self.vnets.pop(vnet_id, None)
+
+        self.last_sync = sync_time
+
+        return len(changed_ids)
+
+    def vnet_list(self):
+        """vNet records shaped like argquery.VNET results."""
+
+        results = []
+
+        for vnet in self.vnets.values():
+            vnet_copy = copy.deepcopy(vnet)
+            vnet_copy['subnets'] = [{k: v for k, v in subnet.items() if k != 'id'} for subnet in vnet_copy['subnets']]
+
+            results.append(vnet_copy)
+
+        return results
+
+    def subnet_list(self):
+        """Subnet records shaped like argquery.SUBNET results."""
+
+        results = []
+
+        for vnet in self.vnets.values():
+            for subnet in vnet['subnets']:
+                results.append({
+                    'name': subnet['name'],
+                    'id': subnet['id'],
+                    'prefix': copy.deepcopy(subnet['prefix']),
+                    'resource_group': vnet['resource_group'],
+                    'subscription_id': vnet['subscription_id'],
+                    'tenant_id': vnet['tenant_id'],
+                    'vnet_name': vnet['name'],
+                    'vnet_id': vnet['id'],
+                    'used': subnet['used'],
+                    'type': subnet['type']
+                })
+
+        return results
@@ -0,0 +1,190 @@
+import uuid
+
+SPLIT_TYPES = ('block', 'external', 'reservation')
+
+class TornSpaceRead(Exception):
+    """A split space root referenced part documents that were not found alongside it."""
+
+def part_id(space_id, gen, kind, key):
+    """Cosmos id of the kind document with the given key in generation gen of a space."""
+
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "{}/{}/{}/{}".format(space_id, gen, kind, key)))
+
+def new_generation():
+    return str(uuid.uuid4())
+
+LAYOUT_KEYS = ('layout', 'gen', 'parts')
+
+def is_split(space):
+    return space.get('layout') == 'split'
+
+def strip_layout(space):
+    """Copy of an assembled space without the split layout's storage keys."""
+
+    return {k: v for k, v in space.items() if k not in LAYOUT_KEYS}
+
+def match_keys(names, refs):
+    """
+    Assign a key to each of names from refs, a list of {"name", "key"} entries
+    describing the stored version. Names are matched to refs by name first;
+    names left over take the remaining keys in order (a rename), and anything
+    still unmatched gets a new key.
+    """
+
+    free = {}
+
+    for ref in refs:
+        free.setdefault(ref['name'], []).append(ref['key'])
+
+    keys = [free[name].pop(0) if free.get(name) else None for name in names]
+
+    used = set(keys)
+    spare = [ref['key'] for ref in refs if ref['key'] not in used]
+
+    return [key or (spare.pop(0) if spare else str(uuid.uuid4())) for key in keys]
+
+def split_space(space, gen):
+    """
+    Break a space document into its root document (the space without blocks)
+    and one generation gen document per block, external network and
+    reservation. Parts are identified by keys that survive renames and
+    reordering: blocks and externals keep the key they were first written
+    with (carried in the 'parts' index of an assembled space), reservations
+    use their own id. The root lists its blocks in order and every block lists
+    its externals and reservations, so moving or renaming one part never
+    rewrites its siblings.
+    """
+
+    root = {k: v for k, v in space.items() if k not in ('blocks', 'parts') and not k.startswith('_')}
+    root['layout'] = 'split'
+    root['gen'] = gen
+    root['parts'] = []
+
+    block_refs = space.get('parts', [])
+    block_map = {x['key']: x for x in block_refs}
+
+    blocks = space.get('blocks', [])
+    block_keys = match_keys([x['name'] for x in blocks], block_refs)
+
+    parts = []
+
+    for block, block_key in zip(blocks, block_keys):
+        externals = block.get('externals', [])
+        reservations = block.get('resv', [])
+
+        ext_keys = match_keys([x['name'] for x in externals], block_map.get(block_key, {}).get('externals', []))
+
+        root['parts'].append({"name": block['name'], "key": block_key})
+
+        parts.append({
+            "id": part_id(space['id'], gen, 'block', block_key),
+            "type": "block",
+            "tenant_id": space['tenant_id'],
+            "space_id": space['id'],
+            "gen": gen,
+            "key": block_key,
+            "externals": [{"name": x['name'], "key": key} for x, key in zip(externals, ext_keys)],
+            "resv": [x['id'] for x in reservations],
+            "block": {k: v for k, v in block.items() if k not in ('externals', 'resv')}
+        })
+
+        for external, ext_key in zip(externals, ext_keys):
+            parts.append({
+                "id": part_id(space['id'], gen, 'external', ext_key),
+                "type": "external",
+                "tenant_id": space['tenant_id'],
+                "space_id": space['id'],
+                "gen": gen,
+                "key": ext_key,
+                "external": external
+            })
+
+        for resv in reservations:
+            parts.append({
+                "id": part_id(space['id'], gen, 'reservation', resv['id']),
+                "type": "reservation",
+                "tenant_id": space['tenant_id'],
+                "space_id": space['id'],
+                "gen": gen,
+                "key": resv['id'],
+                "reservation": resv
+            })
+
+    return root, parts
+
+def assemble_space(root, parts):
+    """
+    Rebuild the single-document view of a split space from its root and part
+    documents. Parts from any generation other than the root's are ignored, so
+    documents staged for (or left behind by) another write are never mixed in.
+    Raises TornSpaceRead if a referenced part is missing, which means a write
+    landed between reading the root and reading its parts. The result keeps a
+    'parts' index of block and external keys for the next split_space().
+    """
+
+    space = dict(root)
+
+    current = {(x['type'], x['key']): x for x in parts if x.get('gen') == root.get('gen')}
+
+    space['blocks'] = []
+    space['parts'] = []
+
+    for block_ref in root.get('parts', []):
+        block_part = current.get(('block', block_ref['key']))
+
+        if block_part is None:
+            raise TornSpaceRead(root['id'])
+
+        externals = [current.get(('external', x['key'])) for x in block_part['externals']]
+        reservations = [current.get(('reservation', x)) for x in block_part['resv']]
+
+        if None in externals or None in reservations:
+            raise TornSpaceRead(root['id'])
+
+        space['blocks'].append(dict(
+            block_part['block'],
+            externals = [x['external'] for x in externals],
+            resv = [x['reservation'] for x in reservations]
+        ))
+
+        space['parts'].append({
+            "name": block_part['block']['name'],
+            "key": block_part['key'],
+            "externals": block_part['externals']
+        })
+
+    return space
+
+def move_generation(root, parts, gen):
+    """Copies of a split root and its parts relabelled as generation gen, keeping every key."""
+
+    root = dict(root, gen = gen)
+    parts = [dict(x, gen = gen, id = part_id(x['space_id'], gen, x['type'], x['key'])) for x in parts]
+
+    return root, parts
+
+def diff_space(old, new):
+    """
+    Compare two single-document views of a space within the generation old was
+    stored in. Returns the new root document, all of its part documents, the
+    part documents that were added or changed, and the ids of parts that no
+    longer exist. old may be None (or an unsplit document) when nothing has been
+    written in the split layout yet, in which case a new generation is started.
+    """
+
+    if old and is_split(old):
+        gen = old['gen']
+        old_parts = split_space(old, gen)[1]
+    else:
+        gen = new_generation()
+        old_parts = []
+
+    root, new_parts = split_space(new, gen)
+
+    old_map = {x['id']: x for x in old_parts}
+    new_ids = set(x['id'] for x in new_parts)
+
+    changed = [x for x in new_parts if old_map.get(x['id']) != x]
+    removed = [x for x in old_map if x not in new_ids]
+
+    return root, new_parts, changed, removed
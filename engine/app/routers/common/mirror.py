@@ -0,0 +1,133 @@
+import copy
+import time
+import asyncio
+from datetime import datetime, timezone
+
+from app.routers.common.layout import SPLIT_TYPES
+
+MIRROR_TYPES = ('space', 'admin', 'user') + SPLIT_TYPES
+
+class CosmosMirror:
+    """
+    In-memory copy of the space (including split layout block, external and
+    reservation documents), admin and user documents for every tenant,
+    kept current from the container change feed. The change feed does not
+    report deletes, so deletes are written as short-lived 'tombstone' documents
+    that drop the original from every instance's mirror when polled.
+
+    Only the change feed, which is ordered within a partition, updates stored
+    documents. Local writes instead mark their tenant as pending, and pending
+    tenants are served from Cosmos until a poll started after the write has
+    completed.
+    """
+
+    def __init__(self, poll_interval, reload_interval):
+        self.poll_interval = poll_interval
+        self.reload_interval = reload_interval
+        self.tenants = {}
+        self.continuation = None
+        self.last_poll = None
+        self.last_reload = None
+        self.pending = {}
+        self._lock = None
+
+    @property
+    def ready(self):
+        """True while the mirror is loaded and has been polled recently enough to trust."""
+
+        if self.last_poll is None:
+            return False
+
+        return (time.monotonic() - self.last_poll) < max(self.poll_interval * 3, 30)
+
+    def current(self, tenant_id):
+        """True if the mirror can be trusted for tenant_id: it is ready and has no unseen local writes."""
+
+        return self.ready and tenant_id not in self.pending
+
+    def invalidate(self, tenant_id):
+        """Record a local write for tenant_id, which the mirror has not seen until the next poll."""
+
+        self.pending[tenant_id] = time.monotonic()
+
+    def apply(self, doc):
+        """Store a change feed doc, or drop the original for a tombstone."""
+
+        if doc.get('type') == 'tombstone':
+            self.remove(doc['tenant_id'], doc['id'])
+            return
+
+        if doc.get('type') not in MIRROR_TYPES:
+            return
+
+        self.tenants.setdefault(doc['tenant_id'], {})[doc['id']] = doc
+
+    def remove(self, tenant_id, item_id):
+        self.tenants.get(tenant_id, {}).pop(item_id, None)
+
+    def find(self, tenant_id, item_type, match = None):
+        """Deep copies of the tenant's documents of item_type (a type or tuple of types), optionally filtered by match(doc)."""
+
+        tenant_docs = self.tenants.get(tenant_id, {})
+        item_types = item_type if isinstance(item_type, tuple) else (item_type,)
+
+        return [copy.deepcopy(doc) for doc in tenant_docs.values() if doc['type'] in item_types and (match is None or match(doc))]
+
+    async def sync(self, container):
+        """Apply pending change feed entries, or reload everything when a reconciliation is due."""
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            started = time.monotonic()
+            reload_due = self.last_reload is None or (time.monotonic() - self.last_reload) >= self.reload_interval
+
+            if reload_due:
+                await self.reload(container)
+            else:
+                await self.poll(container)
+
+            self.pending = {k: v for k, v in self.pending.items() if v >= started}
+            self.last_poll = time.monotonic()
+
+    async def read_feed(self, container, **kwargs):
+        """
+        Apply every change feed entry for kwargs and return the continuation token
+        from the feed's own last page, not from the shared client's last response.
+        """
+
+        pages = []
+
+        def record_page(headers, result):
+            # Also called once with the pager itself before any page is fetched
+            if isinstance(result, dict):
+                pages.append(headers.get('etag'))
+
+        changes = container.query_items_change_feed(response_hook = record_page, **kwargs)
+
+        async for doc in changes:
+            self.apply(doc)
+
+        return pages[-1] if pages and pages[-1] else None
+
+    async def poll(self, container):
+        continuation = await self.read_feed(container, continuation = self.continuation)
+
+        self.continuation = continuation or self.continuation
+
+    async def reload(self, container):
+        continuation = await self.read_feed(container, start_time = datetime.now(timezone.utc))
+
+        docs = container.query_items(
+            query = "SELECT * FROM c WHERE c.type IN ({})".format(", ".join("'{}'".format(x) for x in MIRROR_TYPES))
+        )
+
+        tenants = {}
+
+        async for doc in docs:
+            tenants.setdefault(doc['tenant_id'], {})[doc['id']] = doc
+
+        self.tenants = tenants
+        self.continuation = continuation
+        self.last_reload = time.monotonic()
@@ -0,0 +1,56 @@
+class NetworkIndex:
+    """
+    Reverse index from lowercase Azure network id to the (space name, block name)
+    pairs the network is associated with, in space and block order.
+    """
+
+    def __init__(self, spaces):
+        self.entries = {}
+
+        for space in spaces:
+            for block in space['blocks']:
+                for net_id in dict.fromkeys(x['id'].lower() for x in block['vnets']):
+                    self.entries.setdefault(net_id, []).append((space['name'], block['name']))
+
+    def get(self, net_id):
+        """Return the (space, block) pairs for net_id."""
+
+        return self.entries.get(net_id.lower(), [])
+
+    def parent_space(self, net_id):
+        """Name of the first space net_id is associated with, or None."""
+
+        return next((space for space, _ in self.get(net_id)), None)
+
+    def parent_blocks(self, net_id):
+        """Names of every block net_id is associated with, or None."""
+
+        return [block for _, block in self.get(net_id)] or None
+
+network_indexes = {}
+
+def snapshot_key(spaces):
+    """Identify a space snapshot by its document ids and etags, or None if any etag is unknown."""
+
+    key = tuple((x['id'], x.get('_etag')) for x in spaces)
+
+    return None if any(etag is None for _, etag in key) else key
+
+def get_network_index(tenant_id, spaces):
+    """
+    Return the NetworkIndex for a tenant's space snapshot. The index is rebuilt
+    only when a space has been added, removed or rewritten since the last call.
+    """
+
+    key = snapshot_key(spaces)
+    cached = network_indexes.get(tenant_id)
+
+    if key is not None and cached and cached[0] == key:
+        return cached[1]
+
+    index = NetworkIndex(spaces)
+
+    if key is not None:
+        network_indexes[tenant_id] = (key, index)
+
+    return index
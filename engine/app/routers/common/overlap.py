@@ -0,0 +1,136 @@
+import bisect
+
+from app.routers.common.prefix import parse_prefix
+
+class OverlapIndex:
+    """
+    Sorted-array overlap index over CIDRs. Two CIDRs are always either nested
+    or disjoint, so the entries overlapping a query are the ones starting
+    inside it (a bisect over the sorted start addresses) plus its supernets
+    (one dictionary lookup per shorter prefix length). A lookup costs
+    O(log n + k) rather than a scan over every entry.
+    """
+
+    def __init__(self, entries = ()):
+        self.payloads = []
+        self.starts = {}
+        self.supernets = {}
+
+        spans = {}
+
+        for cidr, payload in entries:
+            first, _, prefixlen, version = parse_prefix(cidr)
+            seq = len(self.payloads)
+
+            self.payloads.append(payload)
+            spans.setdefault(version, []).append((first, seq))
+            self.supernets.setdefault((version, prefixlen, first), []).append(seq)
+
+        for version, items in spans.items():
+            items.sort()
+            self.starts[version] = ([x[0] for x in items], [x[1] for x in items])
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def query(self, cidr):
+        """Return the payloads of every entry overlapping cidr, in the order they were added."""
+
+        first, last, prefixlen, version = parse_prefix(cidr)
+        bits = 32 if version == 4 else 128
+
+        matches = set()
+
+        if version in self.starts:
+            firsts, seqs = self.starts[version]
+            lo = bisect.bisect_left(firsts, first)
+            hi = bisect.bisect_right(firsts, last)
+
+            matches.update(seqs[lo:hi])
+
+        for length in range(prefixlen):
+            start = first & ~((1 << (bits - length)) - 1)
+            matches.update(self.supernets.get((version, length, start), []))
+
+        return [self.payloads[x] for x in sorted(matches)]
+
+class CIDRIndex:
+    """
+    Overlap index over a tenant's network prefixes, Block CIDRs, external
+    networks and unsettled reservations for one inventory/space snapshot.
+    """
+
+    def __init__(self, spaces, nets, net_index):
+        self.nets = nets
+        self.net_index = net_index
+
+        entries = []
+
+        for net_pos, net in enumerate(nets):
+            for prefix in net['prefixes']:
+                entries.append((prefix, ('network', net_pos, prefix)))
+
+        for space in spaces:
+            for block in space['blocks']:
+                entries.append((block['cidr'], ('block', space['name'], block['name'], block['cidr'])))
+
+                for external in block['externals']:
+                    entries.append((external['cidr'], ('external', space['name'], block['name'], external['name'], external['cidr'])))
+
+                for resv in block['resv']:
+                    if not resv['settledOn']:
+                        entries.append((resv['cidr'], ('reservation', space['name'], block['name'], resv['id'], resv['cidr'])))
+
+        self.index = OverlapIndex(entries)
+
+    def networks(self, cidr):
+        """
+        Networks with at least one prefix overlapping cidr, in inventory order.
+        Each is a copy holding only its overlapping prefixes and the Blocks it
+        is associated with.
+        """
+
+        return self.group_networks(self.index.query(cidr))
+
+    def group_networks(self, payloads):
+        overlap = {}
+
+        for payload in payloads:
+            if payload[0] == 'network':
+                overlap.setdefault(payload[1], []).append(payload[2])
+
+        results = []
+
+        for net_pos, prefixes in overlap.items():
+            net = self.nets[net_pos]
+
+            results.append({
+                **net,
+                "prefixes": prefixes,
+                "containers": [{"space": space, "block": block} for space, block in self.net_index.get(net['id'])]
+            })
+
+        return results
+
+    def check(self, cidr):
+        """Everything in the snapshot overlapping cidr, grouped by kind."""
+
+        payloads = self.index.query(cidr)
+
+        result = {
+            "cidr": cidr,
+            "networks": self.group_networks(payloads),
+            "blocks": [],
+            "externals": [],
+            "reservations": []
+        }
+
+        for payload in payloads:
+            if payload[0] == 'block':
+                result['blocks'].append({"space": payload[1], "block": payload[2], "cidr": payload[3]})
+            elif payload[0] == 'external':
+                result['externals'].append({"space": payload[1], "block": payload[2], "name": payload[3], "cidr": payload[4]})
+            elif payload[0] == 'reservation':
+                result['reservations'].append({"space": payload[1], "block": payload[2], "id": payload[3], "cidr": payload[4]})
+
+        return result
@@ -0,0 +1,49 @@
+from functools import lru_cache
+from netaddr import IPNetwork
+
+from app.globals import globals
+
+@lru_cache(maxsize = globals.PREFIX_CACHE_SIZE)
+def parse_prefix(cidr):
+    """
+    Return the (first, last, prefixlen, version) integer span of a CIDR string.
+    Results are memoized process-wide in a bounded LRU, so hot prefixes are
+    parsed once instead of on every comparison.
+    """
+
+    network = IPNetwork(cidr)
+
+    return (network.first, network.last, network.prefixlen, network.version)
+
+def prefix_size(cidr):
+    """Number of addresses in cidr, same as IPNetwork(cidr).size."""
+
+    first, last, _, _ = parse_prefix(cidr)
+
+    return last - first + 1
+
+def prefix_in(inner, outer):
+    """True if every address of inner lies within outer, same as IPNetwork(inner) in IPNetwork(outer)."""
+
+    i_first, i_last, _, i_version = parse_prefix(inner)
+    o_first, o_last, _, o_version = parse_prefix(outer)
+
+    return i_version == o_version and o_first <= i_first and i_last <= o_last
+
+def prefix_overlaps(a, b):
+    """True if a and b share at least one address, same as bool(IPSet([a]) & IPSet([b]))."""
+
+    a_first, a_last, _, a_version = parse_prefix(a)
+    b_first, b_last, _, b_version = parse_prefix(b)
+
+    return a_version == b_version and a_first <= b_last and b_first <= a_last
+
+def prefix_stats():
+    info = parse_prefix.cache_info()
+
+    return {
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hits": info.hits,
+        "misses": info.misses
+    }
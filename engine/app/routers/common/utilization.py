@@ -0,0 +1,173 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from app.routers.common.prefix import parse_prefix
+
+VECTORIZE_MIN_ROWS = 256
+PREFIX_TABLE_SIZE = 1 << 20
+
+def contained_usage_python(pairs):
+    results = []
+
+    for container, prefixes in pairs:
+        c_first, c_last, _, c_version = parse_prefix(container)
+
+        total = 0
+        count = 0
+
+        for prefix in prefixes:
+            first, last, _, version = parse_prefix(prefix)
+
+            if version == c_version and c_first <= first and last <= c_last:
+                total += last - first + 1
+                count += 1
+
+        results.append((total, count))
+
+    return results
+
+class PrefixTable:
+    """
+    Interned IPv4 prefixes with their first and last addresses kept in uint32
+    arrays, so a batch of prefix strings maps to one array of row numbers and
+    every bound is fetched with a single fancy-indexing operation. The table is
+    cleared once it grows past maxsize rows.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+        self.rows = {}
+        self.first = numpy.zeros(1024, dtype = numpy.uint32)
+        self.last = numpy.zeros(1024, dtype = numpy.uint32)
+
+    def add(self, cidr):
+        """Intern cidr and return its row, or -1 if it is not an IPv4 prefix."""
+
+        first, last, _, version = parse_prefix(cidr)
+
+        if version != 4:
+            return -1
+
+        row = len(self.rows)
+
+        if row == len(self.first):
+            self.first = numpy.concatenate((self.first, numpy.zeros(row, dtype = numpy.uint32)))
+            self.last = numpy.concatenate((self.last, numpy.zeros(row, dtype = numpy.uint32)))
+
+        self.first[row] = first
+        self.last[row] = last
+        self.rows[cidr] = row
+
+        return row
+
+    def lookup(self, cidrs):
+        """Return the rows for cidrs as an int64 array, interning any new prefixes."""
+
+        rows = [self.rows.get(x) for x in cidrs]
+
+        if None in rows:
+            for i, cidr in enumerate(cidrs):
+                if rows[i] is None:
+                    rows[i] = self.rows.get(cidr)
+
+                    if rows[i] is None:
+                        rows[i] = self.add(cidr)
+
+        return numpy.array(rows, dtype = numpy.int64)
+
+prefix_table = PrefixTable(PREFIX_TABLE_SIZE) if numpy is not None else None
+
+def contained_usage_numpy(pairs):
+    if len(prefix_table.rows) > prefix_table.maxsize:
+        prefix_table.clear()
+
+    lengths = numpy.array([len(prefixes) for _, prefixes in pairs], dtype = numpy.int64)
+
+    rows = prefix_table.lookup([prefix for _, prefixes in pairs for prefix in prefixes])
+    container_rows = prefix_table.lookup([container for container, _ in pairs])
+
+    if (rows < 0).any() or (container_rows < 0).any():
+        return contained_usage_python(pairs)
+
+    owner = numpy.repeat(numpy.arange(len(pairs)), lengths)
+
+    first = prefix_table.first[rows].astype(numpy.int64)
+    last = prefix_table.last[rows].astype(numpy.int64)
+    c_first = prefix_table.first[container_rows].astype(numpy.int64)[owner]
+    c_last = prefix_table.last[container_rows].astype(numpy.int64)[owner]
+
+    inside = (first >= c_first) & (last <= c_last)
+    sizes = numpy.where(inside, last - first + 1, 0)
+
+    ends = numpy.cumsum(lengths)
+    starts = ends - lengths
+
+    size_sums = numpy.concatenate(([0], numpy.cumsum(sizes)))
+    count_sums = numpy.concatenate(([0], numpy.cumsum(inside, dtype = numpy.int64)))
+
+    totals = (size_sums[ends] - size_sums[starts]).tolist()
+    counts = (count_sums[ends] - count_sums[starts]).tolist()
+
+    return list(zip(totals, counts))
+
+def contained_usage(pairs, engine = 'python'):
+    """
+    For each (container CIDR, prefixes) pair return (total, count): the combined
+    size and the number of prefixes lying entirely within the container. With
+    engine='numpy' (and NumPy installed) every pair is evaluated at once as
+    uint32 start/end arrays; IPv6 input and small requests use the Python loop.
+    Both paths return identical results.
+    """
+
+    pairs = list(pairs)
+
+    if engine == 'numpy' and numpy is not None and sum(len(x[1]) for x in pairs) >= VECTORIZE_MIN_ROWS:
+        return contained_usage_numpy(pairs)
+
+    return contained_usage_python(pairs)
+
+def benchmark(sizes = ((10, 10, 2), (100, 20, 3), (300, 40, 4), (500, 40, 4))):
+    """Time both paths on synthetic tenants of (blocks, vnets per block, prefixes per vnet)."""
+
+    import random
+    import time
+
+    rand = random.Random(0)
+
+    for block_count, vnet_count, prefix_count in sizes:
+        pairs = []
+
+        for b in range(block_count):
+            block = "10.{}.0.0/16".format(b % 256)
+
+            for _ in range(vnet_count):
+                prefixes = ["10.{}.{}.0/{}".format((b + rand.randint(0, 1)) % 256, rand.randint(0, 255), rand.randint(20, 28)) for _ in range(prefix_count)]
+                pairs.append((block, prefixes))
+
+        contained_usage_python(pairs)
+
+        if numpy is not None:
+            contained_usage_numpy(pairs)
+
+        start = time.perf_counter()
+        expected = contained_usage_python(pairs)
+        python_time = time.perf_counter() - start
+
+        line = "{:>6} blocks {:>8} prefixes  python {:8.2f}ms".format(block_count, block_count * vnet_count * prefix_count, python_time * 1000)
+
+        if numpy is not None:
+            start = time.perf_counter()
+            result = contained_usage_numpy(pairs)
+            numpy_time = time.perf_counter() - start
+
+            line += "  numpy {:8.2f}ms  identical: {}".format(numpy_time * 1000, result == expected)
+
+        print(line)
+
+if __name__ == "__main__":
+    benchmark()
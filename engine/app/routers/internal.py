@@ -5,7 +5,7 @@ from fastapi import (
 )
 
 import asyncio
-from netaddr import IPNetwork
+from collections import Counter
 
 from app.dependencies import (
     api_auth_checks,
@@ -15,6 +15,11 @@ from app.dependencies import (
 
 from app.models import *
 
+from app.routers.common.prefix import (
+    prefix_in,
+    prefix_size
+)
+
 from app.routers.space import (
     get_spaces
 )
@@ -44,42 +49,30 @@ async def multi_helper(func, list, *args):
     results = await func(*args)
     list.append(results)
 
-@router.get(
-    "/tree",
-    summary = "Get Space Tree View"
-)
-async def tree(
-    authorization: str = Header(None),
-    tenant_id: str = Depends(get_tenant_id),
-    admin: str = Depends(get_admin)
-):
+def build_tree(spaces, vnets, subnets, endpoints):
     """
-    Get a hierarchical tree view of Spaces, Blocks, Virtual Networks, Subnets, and Endpoints.
+    Build the Space > Block > vNet > Subnet > Endpoint tree in a single pass.
+    vNets, subnets and endpoints are grouped by (lowercase) id up front, keeping
+    their original order, so each level is a dictionary lookup rather than a
+    filter over the full inventory.
     """
 
-    tasks = []
-    space_list=[]
-    vnet_list=[]
-    subnet_list = []
-    endpoint_list = []
+    vnet_index = {}
 
-    tasks.append(asyncio.create_task(multi_helper(get_spaces, space_list, False, True, authorization, tenant_id, True)))
-    tasks.append(asyncio.create_task(multi_helper(get_vnet, vnet_list, authorization, tenant_id, admin)))
-    tasks.append(asyncio.create_task(multi_helper(get_subnet, subnet_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(pe, endpoint_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(vm, endpoint_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(vmss, endpoint_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(fwvnet, endpoint_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(bastion, endpoint_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(vnetgw, endpoint_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(appgw, endpoint_list, authorization, admin)))
-    tasks.append(asyncio.create_task(multi_helper(apim, endpoint_list, authorization, admin)))
+    for position, vnet in enumerate(vnets):
+        vnet_index.setdefault(vnet['id'].lower(), []).append(position)
 
-    await asyncio.gather(*tasks)
+    vnet_subnets = {}
 
-    tree = []
+    for subnet in subnets:
+        vnet_subnets.setdefault(subnet['vnet_id'].lower(), []).append(subnet)
 
-    spaces = [item for sublist in space_list for item in sublist]
+    subnet_endpoints = {}
+
+    for endpoint in endpoints:
+        subnet_endpoints.setdefault(endpoint['subnet_id'].lower(), []).append(endpoint)
+
+    tree = []
 
     for space in spaces:
         space_item = {
@@ -97,59 +90,54 @@ async def tree(
                 }
                 space_item['value'] -= block_item['value']
 
-                vnets = [item for sublist in vnet_list for item in sublist]
-                block_vnets = list(filter(lambda x: x['id'].lower() in (map(lambda y: y['id'].lower(), block['vnets'])), vnets))
+                block_vnet_ids = set(x['id'].lower() for x in block['vnets'])
+                block_vnets = [vnets[i] for i in sorted(i for id in block_vnet_ids for i in vnet_index.get(id, []))]
 
                 if len(block_vnets) > 0:
                     block_item['children'] = []
                     for vnet in block_vnets:
-                        # vnet_details = next((x for x in vnets if x['id'].lower() == vnet.lower()), None)
-                        target_prefix = next((x for x in vnet['prefixes'] if IPNetwork(x) in IPNetwork(block['cidr'])), None)
+                        target_prefix = next((x for x in vnet['prefixes'] if prefix_in(x, block['cidr'])), None)
 
                         vnet_item = {
                             "name": vnet['name'],
-                            "value": IPNetwork(target_prefix).size,
+                            "value": prefix_size(target_prefix),
                             "ip": target_prefix
                         }
                         block_item['value'] -= vnet_item['value']
 
-                        subnets = [item for sublist in subnet_list for item in sublist]
-                        vnet_subnets = list(filter(lambda x: x['vnet_id'].lower() == vnet['id'].lower(), subnets))
+                        child_subnets = vnet_subnets.get(vnet['id'].lower(), [])
 
-                        if len(vnet_subnets) > 0:
+                        if len(child_subnets) > 0:
                             vnet_item['children'] = []
-                            for subnet in vnet_subnets:
+                            for subnet in child_subnets:
                                 subnet_item = {
                                     "name": subnet['name'],
-                                    "value": IPNetwork(subnet['prefix']).size,
+                                    "value": prefix_size(subnet['prefix']),
                                     "ip": subnet['prefix']
                                 }
                                 vnet_item['value'] -= subnet_item['value']
 
-                                endpoints = [item for sublist in endpoint_list for item in sublist]
-                                subnet_endpoints = list(filter(lambda x: x['subnet_id'].lower() == subnet['id'].lower(), endpoints))
-                                unique_subnet_endpoints = list({x['id']: x for x in subnet_endpoints}.values())
+                                child_endpoints = subnet_endpoints.get(subnet['id'].lower(), [])
+
+                                if len(child_endpoints) > 0:
+                                    name_counts = Counter(x['name'] for x in child_endpoints)
+                                    unique_endpoints = {x['id']: x for x in child_endpoints}.values()
 
-                                if len(subnet_endpoints) > 0:
                                     subnet_item['children'] = []
-                                    for endpoint in unique_subnet_endpoints:
+                                    for endpoint in unique_endpoints:
                                         endpoint_item = {
                                             "name": endpoint['name'],
-                                            "value": sum(se['name'] == endpoint['name'] for se in subnet_endpoints),
+                                            "value": name_counts[endpoint['name']],
                                             "ip": endpoint['private_ip']
                                         }
                                         subnet_item['value'] -= endpoint_item['value']
 
-                                        # subnet_item['value'] -= 1
                                         subnet_item['children'].append(endpoint_item)
 
-                                # vnet_item['value'] -= IPNetwork(subnet['prefix']).size
                                 vnet_item['children'].append(subnet_item)
 
-                        # block_item['value'] -= IPNetwork(target_prefix).size
                         block_item['children'].append(vnet_item)
 
-                # space_item['value'] -= block['size']
                 space_item["children"].append(block_item)
 
         tree.append({
@@ -158,3 +146,43 @@ async def tree(
         })
 
     return tree
+
+@router.get(
+    "/tree",
+    summary = "Get Space Tree View"
+)
+async def tree(
+    authorization: str = Header(None),
+    tenant_id: str = Depends(get_tenant_id),
+    admin: str = Depends(get_admin)
+):
+    """
+    Get a hierarchical tree view of Spaces, Blocks, Virtual Networks, Subnets, and Endpoints.
+    """
+
+    tasks = []
+    space_list=[]
+    vnet_list=[]
+    subnet_list = []
+    endpoint_list = []
+
+    tasks.append(asyncio.create_task(multi_helper(get_spaces, space_list, False, True, authorization, tenant_id, True)))
+    tasks.append(asyncio.create_task(multi_helper(get_vnet, vnet_list, authorization, tenant_id, admin)))
+    tasks.append(asyncio.create_task(multi_helper(get_subnet, subnet_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(pe, endpoint_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(vm, endpoint_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(vmss, endpoint_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(fwvnet, endpoint_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(bastion, endpoint_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(vnetgw, endpoint_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(appgw, endpoint_list, authorization, admin)))
+    tasks.append(asyncio.create_task(multi_helper(apim, endpoint_list, authorization, admin)))
+
+    await asyncio.gather(*tasks)
+
+    spaces = [item for sublist in space_list for item in sublist]
+    vnets = [item for sublist in vnet_list for item in sublist]
+    subnets = [item for sublist in subnet_list for item in sublist]
+    endpoints = [item for sublist in endpoint_list for item in sublist]
+
+    return build_tree(spaces, vnets, subnets, endpoints)
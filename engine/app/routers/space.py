@@ -36,13 +36,32 @@ from app.routers.common.helper import (
     cosmos_upsert,
     cosmos_replace,
     cosmos_delete,
-    cosmos_retry
+    cosmos_retry,
+    cosmos_mutate,
+    get_space_docs,
+    get_archived_reservations,
+    rename_archived_reservations
 )
 
 from app.routers.azure import (
     get_network
 )
 
+from app.routers.common.allocator import (
+    FreeSpace,
+    BuddyAllocator,
+    HostBitmap,
+    buddy_cache,
+    carve_subnet
+)
+
+from app.routers.common.layout import strip_layout
+from app.routers.common.netindex import get_network_index
+from app.routers.common.prefix import prefix_in, prefix_size
+from app.routers.common.utilization import contained_usage
+
+from app.globals import globals
+
 from app.logs.logs import ipam_logger as logger
 
 SPACE_NAME_REGEX = "^(?![\._-])([a-zA-Z0-9\._-]){1,64}(?<![\._-])$"
@@ -61,8 +80,54 @@ router = APIRouter(
     dependencies=[Depends(api_auth_checks)]
 )
 
+async def get_space_blocks(space_name, tenant_id):
+    space_query = await get_space_docs(tenant_id, space_name)
+
+    return space_query[0]['blocks'] if space_query else []
+
+def find_by_name(items, name):
+    return next((x for x in items if x['name'].lower() == name.lower()), None)
+
+def add_utilization(blocks, nets, expand):
+    """
+    Set size/used on each Block, and on each expanded network, for every Block
+    in one pass. The network prefixes inside each Block are totalled with a
+    single contained_usage() call across all Blocks.
+    """
+
+    net_map = {}
+
+    for net in nets:
+        net_map.setdefault(net['id'], net)
+
+    block_nets = [block['vnets'] if expand else [net_map.get(x['id']) for x in block['vnets']] for block in blocks]
+    pairs = [(block['cidr'], net['prefixes'] if net else []) for block, targets in zip(blocks, block_nets) for net in targets]
+    usage = iter(contained_usage(pairs, globals.UTILIZATION_ENGINE))
+
+    for block, targets in zip(blocks, block_nets):
+        block['size'] = prefix_size(block['cidr'])
+        block['used'] = 0
+
+        for net in targets:
+            total, count = next(usage)
+            block['used'] += total
+
+            if expand:
+                net['size'] = total
+
+                if count:
+                    net['used'] = 0
+
+                if 'subnets' in net:
+                    for subnet in net['subnets']:
+                        net['used'] += prefix_size(subnet['prefix'])
+                        subnet['size'] = prefix_size(subnet['prefix'])
+
+        for ext in block['externals']:
+            block['used'] += prefix_size(ext['cidr'])
+
 async def valid_space_name_update(name, space_name, tenant_id):
-    space_names = await cosmos_query("SELECT VALUE LOWER(c.name) FROM c WHERE c.type = 'space' AND LOWER(c.name) != LOWER('{}')".format(space_name), tenant_id)
+    space_names = await cosmos_query("SELECT VALUE LOWER(c.name) FROM c WHERE c.type = 'space' AND LOWER(c.name) != LOWER(@space_name)", tenant_id, [{"name": "@space_name", "value": space_name}])
 
     if name.lower() in space_names:
         raise HTTPException(status_code=400, detail="Updated Space name must be unique.")
@@ -110,7 +175,8 @@ async def scrub_space_patch(patch, space_name, tenant_id):
     return scrubbed_patch
 
 async def valid_block_name_update(name, space_name, block_name, tenant_id):
-    other_blocks = await cosmos_query("SELECT VALUE LOWER(t.name) FROM c join t IN c.blocks WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) != LOWER('{}')".format(space_name, block_name), tenant_id)
+    blocks = await get_space_blocks(space_name, tenant_id)
+    other_blocks = [x['name'].lower() for x in blocks if x['name'].lower() != block_name.lower()]
 
     if name.lower() in other_blocks:
         raise HTTPException(status_code=400, detail="Updated Block name cannot match existing Blocks within the Space.")
@@ -124,8 +190,8 @@ async def valid_block_cidr_update(cidr, space_name, block_name, tenant_id):
     space_cidrs = []
     block_cidrs = []
 
-    blocks = await cosmos_query("SELECT VALUE t FROM c join t IN c.blocks WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space_name), tenant_id)
-    target_block = next((x for x in blocks if x['name'].lower() == block_name.lower()), None)
+    blocks = await get_space_blocks(space_name, tenant_id)
+    target_block = find_by_name(blocks, block_name)
 
     if target_block:
         if(cidr == target_block['cidr']):
@@ -207,7 +273,8 @@ async def scrub_block_patch(patch, space_name, block_name, tenant_id):
     return scrubbed_patch
 
 async def valid_ext_network_name_update(name, space_name, block_name, external_name, tenant_id):
-    other_networks = await cosmos_query("SELECT VALUE LOWER(u.name) FROM c join t IN c.blocks join u in t.externals WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}') AND LOWER(u.name) != LOWER('{}')".format(space_name, block_name, external_name), tenant_id)
+    target_block = find_by_name(await get_space_blocks(space_name, tenant_id), block_name)
+    other_networks = [x['name'].lower() for x in (target_block['externals'] if target_block else []) if x['name'].lower() != external_name.lower()]
 
     if name.lower() in other_networks:
         raise HTTPException(status_code=400, detail="Updated External Network name cannot match existing External Networks within the Block.")
@@ -221,11 +288,11 @@ async def valid_ext_network_cidr_update(cidr, space_name, block_name, external_n
     block_cidrs = []
     external_cidrs = []
 
-    blocks = await cosmos_query("SELECT VALUE t FROM c join t IN c.blocks WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space_name), tenant_id)
-    target_block = next((x for x in blocks if x['name'].lower() == block_name.lower()), None)
+    blocks = await get_space_blocks(space_name, tenant_id)
+    target_block = find_by_name(blocks, block_name)
 
-    externals = await cosmos_query("SELECT VALUE u FROM c join t IN c.blocks join u IN t.externals WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}')".format(space_name, block_name), tenant_id)
-    target_external = next((x for x in externals if x['name'].lower() == external_name.lower()), None)
+    externals = target_block['externals'] if target_block else []
+    target_external = find_by_name(externals, external_name)
 
     if target_block and target_external:
         if(cidr == target_external['cidr']):
@@ -316,7 +383,9 @@ async def scrub_ext_network_patch(patch, space_name, block_name, external_name,
     return scrubbed_patch
 
 async def valid_ext_subnet_name_update(name, space_name, block_name, external_name, subnet_name, tenant_id):
-    other_subnets = await cosmos_query("SELECT VALUE v FROM c join t IN c.blocks join u IN t.externals join v IN u.subnets WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}') AND LOWER(u.name) = LOWER('{}') AND LOWER(v.name) != LOWER('{}')".format(space_name, block_name, external_name, subnet_name), tenant_id)
+    target_block = find_by_name(await get_space_blocks(space_name, tenant_id), block_name)
+    target_external = find_by_name(target_block['externals'], external_name) if target_block else None
+    other_subnets = [x['name'].lower() for x in (target_external['subnets'] if target_external else []) if x['name'].lower() != subnet_name.lower()]
 
     if name.lower() in other_subnets:
         raise HTTPException(status_code=400, detail="Updated External Subnet name cannot match existing External Subnets within the External Network.")
@@ -330,11 +399,11 @@ async def valid_ext_subnet_cidr_update(cidr, space_name, block_name, external_na
     external_cidrs = []
     subnet_ips = []
 
-    externals = await cosmos_query("SELECT VALUE u FROM c join t IN c.blocks join u IN t.externals WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}')".format(space_name, block_name), tenant_id)
-    target_external = next((x for x in externals if x['name'].lower() == external_name.lower()), None)
+    target_block = find_by_name(await get_space_blocks(space_name, tenant_id), block_name)
+    target_external = find_by_name(target_block['externals'], external_name) if target_block else None
 
-    subnets = await cosmos_query("SELECT VALUE v FROM c join t IN c.blocks join u IN t.externals join v IN u.subnets WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}') AND LOWER(u.name) = LOWER('{}')".format(space_name, block_name, external_name), tenant_id)
-    target_subnet = next((x for x in subnets if x['name'].lower() == subnet_name.lower()), None)
+    subnets = target_external['subnets'] if target_external else []
+    target_subnet = find_by_name(subnets, subnet_name)
 
     if target_external and target_subnet:
         if(cidr == target_subnet['cidr']):
@@ -414,7 +483,10 @@ async def scrub_ext_subnet_patch(patch, space_name, block_name, external_name, s
     return scrubbed_patch
 
 async def valid_ext_endpoint_name_update(name, space_name, block_name, external_name, subnet_name, endpoint_name, tenant_id):
-    other_endpoints = await cosmos_query("SELECT VALUE x FROM c join t IN c.blocks join u IN t.externals join v IN u.subnets join x in v.endpoints WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}') AND LOWER(u.name) = LOWER('{}') AND LOWER(v.name) = LOWER('{}') AND LOWER(x.name) != LOWER('{}')".format(space_name, block_name, external_name, subnet_name, endpoint_name), tenant_id)
+    target_block = find_by_name(await get_space_blocks(space_name, tenant_id), block_name)
+    target_external = find_by_name(target_block['externals'], external_name) if target_block else None
+    target_subnet = find_by_name(target_external['subnets'], subnet_name) if target_external else None
+    other_endpoints = [x['name'].lower() for x in (target_subnet['endpoints'] if target_subnet else []) if x['name'].lower() != endpoint_name.lower()]
 
     if name.lower() in other_endpoints:
         raise HTTPException(status_code=400, detail="Updated External Endpoint name cannot match existing External Endpoints within the External Subnet.")
@@ -427,11 +499,12 @@ async def valid_ext_endpoint_name_update(name, space_name, block_name, external_
 async def valid_ext_endpoint_ip_update(ip, space_name, block_name, external_name, subnet_name, endpoint_name, tenant_id):
     subnet_ips = []
 
-    subnets = await cosmos_query("SELECT VALUE v FROM c join t IN c.blocks join u IN t.externals join v IN u.subnets WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}') AND LOWER(u.name) = LOWER('{}')".format(space_name, block_name, external_name), tenant_id)
-    target_subnet = next((x for x in subnets if x['name'].lower() == subnet_name.lower()), None)
+    target_block = find_by_name(await get_space_blocks(space_name, tenant_id), block_name)
+    target_external = find_by_name(target_block['externals'], external_name) if target_block else None
+    target_subnet = find_by_name(target_external['subnets'], subnet_name) if target_external else None
 
-    endpoints = await cosmos_query("SELECT VALUE x FROM c join t IN c.blocks join u IN t.externals join v IN u.subnets join x in v.endpoints WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}') AND LOWER(t.name) = LOWER('{}') AND LOWER(u.name) = LOWER('{}') and LOWER(v.name) = LOWER('{}')".format(space_name, block_name, external_name, subnet_name), tenant_id)
-    target_endpoint = next((x for x in endpoints if x['name'].lower() == endpoint_name.lower()), None)
+    endpoints = target_subnet['endpoints'] if target_subnet else []
+    target_endpoint = find_by_name(endpoints, endpoint_name)
 
     if target_subnet and target_endpoint:
         if(ip == target_endpoint['ip']):
@@ -532,13 +605,9 @@ async def get_spaces(
     if expand or utilization:
         nets = await get_network(authorization, True)
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", tenant_id)
+    space_query = await get_space_docs(tenant_id)
 
     for space in space_query:
-        if utilization:
-            space['size'] = 0
-            space['used'] = 0
-
         for block in space['blocks']:
             if expand:
                 expanded_nets = []
@@ -549,41 +618,17 @@ async def get_spaces(
 
                 block['vnets'] = expanded_nets
 
-            if utilization:
-                space['size'] += IPNetwork(block['cidr']).size
-                block['size'] = IPNetwork(block['cidr']).size
-                block['used'] = 0
-
-                for net in block['vnets']:
-                    if expand:
-                        net['size'] = 0
-                        net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(block['cidr']), net['prefixes']))
-                    else:
-                        target_net = next((i for i in nets if i['id'] == net['id']), None)
-                        net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(block['cidr']), target_net['prefixes'])) if target_net else []
-
-                    for prefix in net_prefixes:
-                        space['used'] += IPNetwork(prefix).size
-                        block['used'] += IPNetwork(prefix).size
-
-                        if expand:
-                            net['size'] += IPNetwork(prefix).size
-                            net['used'] = 0
-
-                    if expand:
-                        if 'subnets' in net:
-                            for subnet in net['subnets']:
-                                net['used'] += IPNetwork(subnet['prefix']).size
-                                subnet['size'] = IPNetwork(subnet['prefix']).size
-
-                for ext in block['externals']:
-                    space['used'] += IPNetwork(ext['cidr']).size
-                    block['used'] += IPNetwork(ext['cidr']).size
-
             if not is_admin:
                 user_name = get_username_from_jwt(user_assertion)
                 block['resv'] = list(filter(lambda x: x['createdBy'] == user_name, block['resv']))
 
+    if utilization:
+        add_utilization([block for space in space_query for block in space['blocks']], nets, expand)
+
+        for space in space_query:
+            space['size'] = sum(block['size'] for block in space['blocks'])
+            space['used'] = sum(block['used'] for block in space['blocks'])
+
     if not is_admin:
         if utilization:
             return [SpaceBasicUtil(**item) for item in space_query]
@@ -624,7 +669,7 @@ async def create_space(
     if not re.match(SPACE_DESC_REGEX, space.desc, re.IGNORECASE):
         raise HTTPException(status_code=400, detail="Space description can be a maximum of 64 characters and may contain alphanumerics, spaces, underscores, hypens, slashes, and periods.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", tenant_id)
+    space_query = await get_space_docs(tenant_id)
 
     duplicate = next((x for x in space_query if x['name'].lower() == space.name.lower()), None)
 
@@ -639,6 +684,9 @@ async def create_space(
         "blocks": []
     }
 
+    if globals.SPACE_LAYOUT == 'split':
+        new_space['layout'] = 'split'
+
     await cosmos_upsert(jsonable_encoder(new_space))
 
     return new_space
@@ -673,7 +721,7 @@ async def get_space(
     if expand and not is_admin:
         raise HTTPException(status_code=403, detail="Expand parameter can only be used by admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -683,10 +731,6 @@ async def get_space(
     if expand or utilization:
         nets = await get_network(authorization, is_admin)
 
-    if utilization:
-        target_space['size'] = 0
-        target_space['used'] = 0
-
     for block in target_space['blocks']:
         if expand:
             expanded_nets = []
@@ -697,41 +741,16 @@ async def get_space(
 
             block['vnets'] = expanded_nets
 
-        if utilization:
-            target_space['size'] += IPNetwork(block['cidr']).size
-            block['size'] = IPNetwork(block['cidr']).size
-            block['used'] = 0
-
-            for net in block['vnets']:
-                if expand:
-                    net['size'] = 0
-                    net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(block['cidr']), net['prefixes']))
-                else:
-                    target_net = next((i for i in nets if i['id'] == net['id']), None)
-                    net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(block['cidr']), target_net['prefixes'])) if target_net else []
-
-                for prefix in net_prefixes:
-                    target_space['used'] += IPNetwork(prefix).size
-                    block['used'] += IPNetwork(prefix).size
-
-                    if expand:
-                        net['size'] += IPNetwork(prefix).size
-                        net['used'] = 0
-
-                if expand:
-                    if 'subnets' in net:
-                        for subnet in net['subnets']:
-                            net['used'] += IPNetwork(subnet['prefix']).size
-                            subnet['size'] = IPNetwork(subnet['prefix']).size
-
-            for ext in block['externals']:
-                space['used'] += IPNetwork(ext['cidr']).size
-                block['used'] += IPNetwork(ext['cidr']).size
-
         if not is_admin:
             user_name = get_username_from_jwt(user_assertion)
             block['resv'] = list(filter(lambda x: x['createdBy'] == user_name, block['resv']))
 
+    if utilization:
+        add_utilization(target_space['blocks'], nets, expand)
+
+        target_space['size'] = sum(block['size'] for block in target_space['blocks'])
+        target_space['used'] = sum(block['used'] for block in target_space['blocks'])
+
     if not is_admin:
         if utilization:
             return SpaceBasicUtil(**target_space)
@@ -773,7 +792,7 @@ async def update_space(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -790,7 +809,7 @@ async def update_space(
 
     await cosmos_replace(target_space, update_space)
 
-    return update_space
+    return strip_layout(update_space)
 
 @router.delete(
     "/{space}",
@@ -815,7 +834,7 @@ async def delete_space(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -849,7 +868,7 @@ async def get_multi_block_reservations(
 
     user_assertion = authorization.split(' ')[1]
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -870,6 +889,14 @@ async def get_multi_block_reservations(
 
         resv_list += reservations
 
+    if settled:
+        resv_ids = set(x['id'] for x in resv_list)
+        archived = await get_archived_reservations(tenant_id, target_space['id'])
+
+        for item in archived:
+            if item['reservation']['id'] not in resv_ids:
+                resv_list.append(dict(item['reservation'], space = target_space['name'], block = item['block']))
+
     if not is_admin:
         user_name = get_username_from_jwt(user_assertion)
         return list(filter(lambda x: x['createdBy'] == user_name, resv_list))
@@ -882,10 +909,6 @@ async def get_multi_block_reservations(
     response_model = ReservationExpand,
     status_code = 201
 )
-@cosmos_retry(
-    max_retry = 5,
-    error_msg = "Error creating cidr reservation, please try again."
-)
 async def create_multi_block_reservation(
     req: SpaceCIDRReq,
     space: str = Path(..., description="Name of the target Space"),
@@ -909,7 +932,7 @@ async def create_multi_block_reservation(
     user_assertion = authorization.split(' ')[1]
     decoded = jwt.decode(user_assertion, options={"verify_signature": False})
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -925,21 +948,166 @@ async def create_multi_block_reservation(
 
     net_list = await get_network(authorization, True)
 
-    available_slicer = slice(None, None, -1) if req.reverse_search else slice(None)
-    next_selector = -1 if req.reverse_search else 0
+    if "preferred_username" in decoded:
+        creator_id = decoded["preferred_username"]
+    else:
+        creator_id = f"spn:{decoded['oid']}"
+
+    def reserve_cidr(space_doc):
+        available_block = None
+        available_block_name = None
 
-    available_block = None
-    available_block_name = None
+        for block in req.blocks:
+            if not available_block:
+                target_block = next((x for x in space_doc['blocks'] if x['name'].lower() == block.lower()), None)
+
+                if not target_block:
+                    raise HTTPException(status_code=400, detail="Invalid Block(s) in Block list: {}.".format([block]))
+
+                block_all_cidrs = []
+
+                for v in target_block['vnets']:
+                    target = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
+                    prefixes = list(filter(lambda x: prefix_in(x, target_block['cidr']), target['prefixes'])) if target else []
+                    block_all_cidrs += prefixes
+
+                for r in (r for r in target_block['resv'] if not r['settledOn']):
+                    block_all_cidrs.append(r['cidr'])
+
+                for e in (e for e in target_block['externals']):
+                    block_all_cidrs.append(e['cidr'])
+
+                if req.smallest_cidr:
+                    block_key = (tenant_id, space_doc['id'], target_block['name'].lower())
+                    available_set = buddy_cache.get(block_key, target_block['cidr'], block_all_cidrs)
+                    available_block = available_set.find_block(req.size, req.reverse_search)
+                else:
+                    available_set = FreeSpace([target_block['cidr']], block_all_cidrs)
+                    available_block = available_set.find_block(req.size, req.reverse_search)
+
+                available_block_name = block if available_block else None
+                resv_block = target_block
 
-    for block in req.blocks:
         if not available_block:
-            target_block = next((x for x in target_space['blocks'] if x['name'].lower() == block.lower()), None)
+            raise HTTPException(status_code=500, detail="Network of requested size unavailable in target block(s).")
+
+        next_cidr = carve_subnet(available_block, req.size, req.reverse_search)
+
+        new_cidr = {
+            "id": shortuuid.uuid(),
+            "cidr": str(next_cidr),
+            "desc": req.desc,
+            "createdOn": time.time(),
+            "createdBy": creator_id,
+            "settledOn": None,
+            "settledBy": None,
+            "status": "wait"
+        }
+
+        resv_block['resv'].append(new_cidr)
+
+        return dict(new_cidr, space = space_doc['name'], block = available_block_name)
+
+    return await cosmos_mutate(
+        space_query[0],
+        reserve_cidr,
+        "create_multi_block_reservation",
+        "Error creating cidr reservation, please try again."
+    )
+
+@router.post(
+    "/{space}/reservations/batch",
+    summary = "Create Multiple CIDR Reservations",
+    response_model = List[ReservationBatchResult],
+    status_code = 201
+)
+async def create_batch_reservations(
+    req: BatchCIDRReq,
+    space: str = Path(..., description="Name of the target Space"),
+    authorization: str = Header(None, description="Azure Bearer token"),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """
+    Create multiple CIDR Reservations against a single snapshot of the Space with the following information:
+
+    - **blocks**: Array of Block names (*Evaluated in the order provided*)
+    - **reservations**: Array of Reservation requests (*Allocated in the order provided*)
+
+    Reservation request:
+
+    - **blocks**: Array of Block names overriding the top-level list (optional)
+    - **size**: Network mask bits
+    - **cidr**: Specific CIDR to reserve (alternative to 'size')
+    - **desc**: Description (optional)
+    - **reverse_search**:
+        - **true**: New networks will be created as close to the <u>end</u> of the block as possible
+        - **false (default)**: New networks will be created as close to the <u>beginning</u> of the block as possible
+    - **smallest_cidr**:
+        - **true**: New networks will be created using the smallest possible available block (e.g. it will not break up large CIDR blocks when possible)
+        - **false (default)**: New networks will be created using the first available block, regardless of size
+
+    Every successful reservation is saved in a single write. The response contains one result per
+    request, in order, with either the new reservation or the reason it could not be created.
+
+    ### <u>Usage Examples</u>
+
+    #### *Request two /24s and a specific /26:*
+
+    ```json
+    {
+        "blocks": ["BlockA", "BlockB"],
+        "reservations": [
+            { "size": 24, "desc": "Landing Zone 1" },
+            { "size": 24, "desc": "Landing Zone 2", "smallest_cidr": true },
+            { "cidr": "10.1.5.0/26", "desc": "Landing Zone 3", "blocks": ["BlockB"] }
+        ]
+    }
+    ```
+    """
+
+    user_assertion = authorization.split(' ')[1]
+    decoded = jwt.decode(user_assertion, options={"verify_signature": False})
+
+    space_query = await get_space_docs(tenant_id, space)
+
+    try:
+        target_space = copy.deepcopy(space_query[0])
+    except:
+        raise HTTPException(status_code=400, detail="Invalid space name.")
+
+    request_blocks = set(req.blocks)
+
+    for item in req.reservations:
+        request_blocks |= set(item.blocks or [])
+
+    space_blocks = set([x['name'] for x in target_space['blocks']])
+    invalid_blocks = (request_blocks - space_blocks)
+
+    if invalid_blocks:
+        raise HTTPException(status_code=400, detail="Invalid Block(s) in Block list: {}.".format(list(invalid_blocks)))
+
+    net_list = await get_network(authorization, True)
+    net_map = {x['id'].lower(): x for x in net_list}
+
+    if "preferred_username" in decoded:
+        creator_id = decoded["preferred_username"]
+    else:
+        creator_id = f"spn:{decoded['oid']}"
+
+    def reserve_cidrs(space_doc):
+        block_state = {}
+
+        for block in request_blocks:
+            target_block = next((x for x in space_doc['blocks'] if x['name'].lower() == block.lower()), None)
+
+            if not target_block:
+                raise HTTPException(status_code=400, detail="Invalid Block(s) in Block list: {}.".format([block]))
 
             block_all_cidrs = []
 
             for v in target_block['vnets']:
-                target = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
-                prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(target_block['cidr']), target['prefixes'])) if target else []
+                target = net_map.get(v['id'].lower())
+                prefixes = list(filter(lambda x: prefix_in(x, target_block['cidr']), target['prefixes'])) if target else []
                 block_all_cidrs += prefixes
 
             for r in (r for r in target_block['resv'] if not r['settledOn']):
@@ -948,48 +1116,92 @@ async def create_multi_block_reservation(
             for e in (e for e in target_block['externals']):
                 block_all_cidrs.append(e['cidr'])
 
-            block_set = IPSet([target_block['cidr']])
-            reserved_set = IPSet(block_all_cidrs)
-            available_set = block_set ^ reserved_set
+            block_state[block] = {
+                "block": target_block,
+                "used": block_all_cidrs,
+                "free": FreeSpace([target_block['cidr']], block_all_cidrs),
+                "buddy": None
+            }
 
-            if req.smallest_cidr:
-                cidr_list = list(filter(lambda x: x.prefixlen <= req.size, available_set.iter_cidrs()[available_slicer]))
-                min_mask = max(map(lambda x: x.prefixlen, cidr_list), default = None)
-                available_block = next((net for net in list(filter(lambda network: network.prefixlen == min_mask, cidr_list))), None)
-            else:
-                available_block = next((net for net in list(available_set.iter_cidrs())[available_slicer] if net.prefixlen <= req.size), None)
+        results = []
 
-            available_block_name = block if available_block else None
+        for index, item in enumerate(req.reservations):
+            next_cidr = None
+            target_state = None
+            error = None
 
-    if not available_block:
-        raise HTTPException(status_code=500, detail="Network of requested size unavailable in target block(s).")
+            for block in (item.blocks or req.blocks):
+                state = block_state[block]
 
-    next_cidr = list(available_block.subnet(req.size))[next_selector]
+                if item.cidr is not None:
+                    if prefix_in(str(item.cidr), state['block']['cidr']):
+                        target_state = state
 
-    if "preferred_username" in decoded:
-        creator_id = decoded["preferred_username"]
-    else:
-        creator_id = f"spn:{decoded['oid']}"
+                        if IPNetwork(str(item.cidr)) in state['free']:
+                            next_cidr = IPNetwork(str(item.cidr))
+                        else:
+                            error = "Requested CIDR overlaps existing network(s)."
 
-    new_cidr = {
-        "id": shortuuid.uuid(),
-        "cidr": str(next_cidr),
-        "desc": req.desc,
-        "createdOn": time.time(),
-        "createdBy": creator_id,
-        "settledOn": None,
-        "settledBy": None,
-        "status": "wait"
-    }
+                        break
+                else:
+                    if item.smallest_cidr:
+                        if state['buddy'] is None:
+                            state['buddy'] = BuddyAllocator(state['block']['cidr'], state['used'])
 
-    target_block['resv'].append(new_cidr)
+                        available_block = state['buddy'].find_block(item.size, item.reverse_search)
+                    else:
+                        available_block = state['free'].find_block(item.size, item.reverse_search)
 
-    await cosmos_replace(space_query[0], target_space)
+                    if available_block:
+                        target_state = state
+                        next_cidr = carve_subnet(available_block, item.size, item.reverse_search)
+
+                        break
+
+            if next_cidr is None:
+                if error is None:
+                    if item.cidr is not None:
+                        error = "Requested CIDR outside of target block(s)."
+                    else:
+                        error = "Network of requested size unavailable in target block(s)."
+
+                results.append({ "index": index, "success": False, "error": error })
+
+                continue
+
+            target_state['used'].append(str(next_cidr))
+            target_state['free'].reserve(next_cidr)
 
-    new_cidr['space'] = target_space['name']
-    new_cidr['block'] = available_block_name
+            if target_state['buddy'] is not None:
+                target_state['buddy'].reserve(next_cidr)
 
-    return new_cidr
+            new_cidr = {
+                "id": shortuuid.uuid(),
+                "cidr": str(next_cidr),
+                "desc": item.desc,
+                "createdOn": time.time(),
+                "createdBy": creator_id,
+                "settledOn": None,
+                "settledBy": None,
+                "status": "wait"
+            }
+
+            target_state['block']['resv'].append(new_cidr)
+
+            results.append({
+                "index": index,
+                "success": True,
+                "reservation": dict(new_cidr, space = space_doc['name'], block = target_state['block']['name'])
+            })
+
+        return results
+
+    return await cosmos_mutate(
+        space_query[0],
+        reserve_cidrs,
+        "create_batch_reservations",
+        "Error creating cidr reservations, please try again."
+    )
 
 @router.get(
     "/{space}/blocks",
@@ -1021,7 +1233,7 @@ async def get_blocks(
     if expand and not is_admin:
         raise HTTPException(status_code=403, detail="Expand parameter can only be used by admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1043,38 +1255,13 @@ async def get_blocks(
 
             block['vnets'] = expanded_nets
 
-        if utilization:
-            block['size'] = IPNetwork(block['cidr']).size
-            block['used'] = 0
-
-            for net in block['vnets']:
-                if expand:
-                    net['size'] = 0
-                    net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(block['cidr']), net['prefixes']))
-                else:
-                    target_net = next((i for i in nets if i['id'] == net['id']), None)
-                    net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(block['cidr']), target_net['prefixes'])) if target_net else []
-
-                for prefix in net_prefixes:
-                    block['used'] += IPNetwork(prefix).size
-
-                    if expand:
-                        net['size'] += IPNetwork(prefix).size
-                        net['used'] = 0
-
-                if expand:
-                    if 'subnets' in net:
-                        for subnet in net['subnets']:
-                            net['used'] += IPNetwork(subnet['prefix']).size
-                            subnet['size'] = IPNetwork(subnet['prefix']).size
-
-            for ext in block['externals']:
-                block['used'] += IPNetwork(ext['cidr']).size
-
         if not is_admin:
             user_name = get_username_from_jwt(user_assertion)
             block['resv'] = list(filter(lambda x: x['createdBy'] == user_name, block['resv']))
 
+    if utilization:
+        add_utilization(block_list, nets, expand)
+
     if not is_admin:
         if utilization:
             return [BlockBasicUtil(**item) for item in target_space['blocks']]
@@ -1110,7 +1297,7 @@ async def create_block(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1179,7 +1366,7 @@ async def get_block(
     if expand and not is_admin:
         raise HTTPException(status_code=403, detail="Expand parameter can only be used by admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1204,32 +1391,7 @@ async def get_block(
         target_block['vnets'] = expanded_nets
 
     if utilization:
-        target_block['size'] = IPNetwork(target_block['cidr']).size
-        target_block['used'] = 0
-
-        for net in target_block['vnets']:
-            if expand:
-                net['size'] = 0
-                net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(target_block['cidr']), net['prefixes']))
-            else:
-                target_net = next((i for i in nets if i['id'] == net['id']), None)
-                net_prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(target_block['cidr']), target_net['prefixes'])) if target_net else []
-
-            for prefix in net_prefixes:
-                target_block['used'] += IPNetwork(prefix).size
-
-                if expand:
-                    net['size'] += IPNetwork(prefix).size
-                    net['used'] = 0
-
-            if expand:
-                if 'subnets' in net:
-                    for subnet in net['subnets']:
-                        net['used'] += IPNetwork(subnet['prefix']).size
-                        subnet['size'] = IPNetwork(subnet['prefix']).size
-
-        for ext in target_block['externals']:
-            target_block['used'] += IPNetwork(ext['cidr']).size
+        add_utilization([target_block], nets, expand)
 
     if not is_admin:
         user_name = get_username_from_jwt(user_assertion)
@@ -1277,7 +1439,7 @@ async def update_block(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1295,11 +1457,16 @@ async def update_block(
     except jsonpatch.InvalidJsonPatch:
         raise HTTPException(status_code=500, detail="Invalid JSON patch, please review and try again.")
 
+    block_name = update_block['name']
+
     scrubbed_patch = jsonpatch.JsonPatch(await scrub_block_patch(patch, space, block, tenant_id))
     scrubbed_patch.apply(update_block, in_place=True)
 
     await cosmos_replace(target_space, update_space)
 
+    if update_block['name'] != block_name:
+        await rename_archived_reservations(tenant_id, update_space['id'], block_name, update_block['name'])
+
     return update_block
 
 @router.delete(
@@ -1326,7 +1493,7 @@ async def delete_block(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1377,7 +1544,7 @@ async def available_block_nets(
     # if not is_admin:
     #     raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", tenant_id)
+    space_query = await get_space_docs(tenant_id)
 
     target_space = next((x for x in space_query if x['name'].lower() == space.lower()), None)
 
@@ -1396,7 +1563,7 @@ async def available_block_nets(
     excluded_cidrs = (resv_cidrs | ext_cidrs)
 
     for net in net_list:
-        valid = list(filter(lambda x: (IPNetwork(x) in IPNetwork(target_block['cidr']) and not (IPSet([x]) & excluded_cidrs)), net['prefixes']))
+        valid = list(filter(lambda x: (prefix_in(x, target_block['cidr']) and not (IPSet([x]) & excluded_cidrs)), net['prefixes']))
 
         if valid:
             net['prefixes'] = valid
@@ -1406,14 +1573,9 @@ async def available_block_nets(
     # assigned_vnets = [''.join(vnet) for space in item['spaces'] for block in space['blocks'] for vnet in block['vnets']]
     # unassigned_vnets = list(set(available_vnets) - set(assigned_vnets)) + list(set(assigned_vnets) - set(available_vnets))
 
-    for space_iter in space_query:
-        for block_iter in space_iter['blocks']:
-            for net_iter in block_iter['vnets']:
-                if space_iter['name'] != space and block_iter['name'] != block:
-                    net_index = next((i for i, item in enumerate(available_vnets) if item['id'] == net_iter['id']), None)
+    net_index = get_network_index(tenant_id, space_query)
 
-                    if net_index:
-                        del available_vnets[net_index]
+    available_vnets = [net for net in available_vnets if not any((space_iter != space and block_iter != block) for space_iter, block_iter in net_index.get(net['id']))]
 
     if expand:
         return available_vnets
@@ -1447,7 +1609,7 @@ async def get_block_nets(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1476,10 +1638,6 @@ async def get_block_nets(
     response_model = BlockBasic,
     status_code = 201
 )
-@cosmos_retry(
-    max_retry = 5,
-    error_msg = "Error adding network to block, please try again."
-)
 async def create_block_net(
     vnet: VNet,
     space: str = Path(..., description="Name of the target Space"),
@@ -1497,7 +1655,7 @@ async def create_block_net(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1519,37 +1677,52 @@ async def create_block_net(
     if not target_net:
         raise HTTPException(status_code=400, detail="Invalid network ID.")
 
-    target_cidr = next((x for x in target_net['prefixes'] if IPNetwork(x) in IPNetwork(target_block['cidr'])), None)
+    vnet.active = True
 
-    if not target_cidr:
-        raise HTTPException(status_code=400, detail="Network CIDR not within block CIDR.")
+    def add_block_net(space_doc):
+        target_block = next((x for x in space_doc['blocks'] if x['name'].lower() == block.lower()), None)
 
-    block_net_cidrs = []
+        if not target_block:
+            raise HTTPException(status_code=400, detail="Invalid block name.")
 
-    resv_cidrs = list(x['cidr'] for x in target_block['resv'] if not x['settledOn'])
-    block_net_cidrs += resv_cidrs
+        if vnet.id in [v['id'] for v in target_block['vnets']]:
+            raise HTTPException(status_code=400, detail="Network already exists in block.")
 
-    ext_cidrs = list(x['cidr'] for x in target_block['externals'])
-    block_net_cidrs += ext_cidrs
+        target_cidr = next((x for x in target_net['prefixes'] if prefix_in(x, target_block['cidr'])), None)
 
-    for v in target_block['vnets']:
-        target = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
+        if not target_cidr:
+            raise HTTPException(status_code=400, detail="Network CIDR not within block CIDR.")
 
-        if target:
-            prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(target_block['cidr']), target['prefixes']))
-            block_net_cidrs += prefixes
+        block_net_cidrs = []
 
-    cidr_overlap = IPSet(block_net_cidrs) & IPSet([target_cidr])
+        resv_cidrs = list(x['cidr'] for x in target_block['resv'] if not x['settledOn'])
+        block_net_cidrs += resv_cidrs
 
-    if cidr_overlap:
-        raise HTTPException(status_code=400, detail="Block already contains network(s) and/or reservation(s) within the CIDR range of target network.")
+        ext_cidrs = list(x['cidr'] for x in target_block['externals'])
+        block_net_cidrs += ext_cidrs
 
-    vnet.active = True
-    target_block['vnets'].append(jsonable_encoder(vnet))
+        for v in target_block['vnets']:
+            target = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
 
-    await cosmos_replace(space_query[0], target_space)
+            if target:
+                prefixes = list(filter(lambda x: prefix_in(x, target_block['cidr']), target['prefixes']))
+                block_net_cidrs += prefixes
+
+        cidr_overlap = IPSet(block_net_cidrs) & IPSet([target_cidr])
+
+        if cidr_overlap:
+            raise HTTPException(status_code=400, detail="Block already contains network(s) and/or reservation(s) within the CIDR range of target network.")
+
+        target_block['vnets'].append(jsonable_encoder(vnet))
 
-    return target_block
+        return target_block
+
+    return await cosmos_mutate(
+        space_query[0],
+        add_block_net,
+        "create_block_net",
+        "Error adding network to block, please try again."
+    )
 
 # THE REQUEST BODY ITEM SHOULD MATCH THE BLOCK VALUE THAT IS BEING PATCHED
 @router.put(
@@ -1579,7 +1752,7 @@ async def update_block_vnets(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1605,13 +1778,18 @@ async def update_block_vnets(
     resv_cidrs = IPSet(x['cidr'] for x in target_block['resv'] if not x['settledOn'])
     ext_cidrs = IPSet(x['cidr'] for x in target_block['externals'])
 
+    net_map = {}
+
+    for net in net_list:
+        net_map.setdefault(net['id'].lower(), net)
+
     for v in vnets:
-        target_net = next((x for x in net_list if x['id'].lower() == v.lower()), None)
+        target_net = net_map.get(v.lower())
 
         if not target_net:
             invalid_nets.append(v)
         else:
-            target_cidr = next((x for x in target_net['prefixes'] if IPNetwork(x) in IPNetwork(target_block['cidr'])), None)
+            target_cidr = next((x for x in target_net['prefixes'] if prefix_in(x, target_block['cidr'])), None)
 
             if not target_cidr:
                 outside_block_cidr.append(v)
@@ -1678,7 +1856,7 @@ async def delete_block_nets(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1739,7 +1917,7 @@ async def get_external_networks(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1788,7 +1966,7 @@ async def create_external_network(
     if not re.match(EXTERNAL_DESC_REGEX, req.desc, re.IGNORECASE):
         raise HTTPException(status_code=400, detail="External network description can be a maximum of 128 characters and may contain alphanumerics, spaces, underscores, hypens, slashes, and periods.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1811,13 +1989,13 @@ async def create_external_network(
         target = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
 
         if target:
-            prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(target_block['cidr']), target['prefixes']))
+            prefixes = list(filter(lambda x: prefix_in(x, target_block['cidr']), target['prefixes']))
             block_net_cidrs += prefixes
 
     block_set = IPSet(block_net_cidrs)
     resv_set = IPSet(x['cidr'] for x in target_block['resv'] if not x['settledOn'])
     external_set = IPSet(x['cidr'] for x in target_block['externals'])
-    available_set = IPSet([target_block['cidr']]) ^ (resv_set | external_set | block_set)
+    available_set = FreeSpace([target_block['cidr']], block_net_cidrs + [x['cidr'] for x in target_block['resv'] if not x['settledOn']] + [x['cidr'] for x in target_block['externals']])
 
     if req.cidr is not None:
         try:
@@ -1840,12 +2018,12 @@ async def create_external_network(
         if IPSet([req.cidr]) & block_set:
             raise HTTPException(status_code=400, detail="Block contains a virtual network(s) or hub(s) which overlap the target external network.")
     else:
-        available_network = next((net for net in list(available_set.iter_cidrs()) if net.prefixlen <= req.size), None)
+        available_network = available_set.find_block(req.size)
 
         if not available_network:
             raise HTTPException(status_code=500, detail="Network of requested size unavailable in target block.")
 
-        next_cidr = list(available_network.subnet(req.size))[0]
+        next_cidr = carve_subnet(available_network, req.size)
     
     new_external = {
         "name": req.name,
@@ -1884,7 +2062,7 @@ async def get_external_network(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1939,7 +2117,7 @@ async def update_ext_network(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -1994,7 +2172,7 @@ async def delete_external_network(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2042,7 +2220,7 @@ async def get_external_subnets(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2098,7 +2276,7 @@ async def create_external_subnet(
     if not re.match(EXTSUBNET_DESC_REGEX, req.desc, re.IGNORECASE):
         raise HTTPException(status_code=400, detail="External subnet description can be a maximum of 128 characters and may contain alphanumerics, spaces, underscores, hypens, slashes, and periods.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2120,9 +2298,7 @@ async def create_external_subnet(
 
     subnet_cidrs = [s['cidr'] for s in target_external['subnets']]
 
-    external_set = IPSet([target_external['cidr']])
-    subnet_set = IPSet(subnet_cidrs)
-    available_set = external_set ^ subnet_set
+    available_set = FreeSpace([target_external['cidr']], subnet_cidrs)
 
     if req.cidr is not None:
         try:
@@ -2139,12 +2315,12 @@ async def create_external_subnet(
         if next_cidr not in available_set:
             raise HTTPException(status_code=409, detail="Requested subnet CIDR overlaps existing subnet(s).")
     else:
-        available_subnet = next((net for net in list(available_set.iter_cidrs()) if net.prefixlen <= req.size), None)
+        available_subnet = available_set.find_block(req.size)
 
         if not available_subnet:
             raise HTTPException(status_code=500, detail="Subnet of requested size unavailable in target external network.")
 
-        next_cidr = list(available_subnet.subnet(req.size))[0]
+        next_cidr = carve_subnet(available_subnet, req.size)
 
     new_subnet = {
         "name": req.name,
@@ -2185,7 +2361,7 @@ async def get_external_subnet(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2246,7 +2422,7 @@ async def update_ext_subnet(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2307,7 +2483,7 @@ async def delete_external_subnet(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2361,7 +2537,7 @@ async def get_external_subnet_endpoints(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2391,10 +2567,6 @@ async def get_external_subnet_endpoints(
     response_model = ExtEndpoint,
     status_code = 200
 )
-@cosmos_retry(
-    max_retry = 5,
-    error_msg = "Error creating external network subnet endpoint, please try again."
-)
 async def create_external_subnet_endpoint(
     endpoint: ExtEndpointReq,
     space: str = Path(..., description="Name of the target Space"),
@@ -2416,69 +2588,76 @@ async def create_external_subnet_endpoint(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
-    try:
-        target_space = copy.deepcopy(space_query[0])
-    except:
+    if not space_query:
         raise HTTPException(status_code=400, detail="Invalid space name.")
 
-    target_block = next((x for x in target_space['blocks'] if x['name'].lower() == block.lower()), None)
+    def add_endpoint(space_doc):
+        new_endpoint = copy.deepcopy(endpoint)
 
-    if not target_block:
-        raise HTTPException(status_code=400, detail="Invalid block name.")
+        target_block = next((x for x in space_doc['blocks'] if x['name'].lower() == block.lower()), None)
 
-    target_ext_network = next((x for x in target_block['externals'] if x['name'].lower() == external.lower()), None)
+        if not target_block:
+            raise HTTPException(status_code=400, detail="Invalid block name.")
 
-    if not target_ext_network:
-        raise HTTPException(status_code=400, detail="Invalid external network name.")
+        target_ext_network = next((x for x in target_block['externals'] if x['name'].lower() == external.lower()), None)
 
-    target_ext_subnet = next((x for x in target_ext_network['subnets'] if x['name'].lower() == subnet.lower()), None)
+        if not target_ext_network:
+            raise HTTPException(status_code=400, detail="Invalid external network name.")
 
-    if not target_ext_subnet:
-        raise HTTPException(status_code=400, detail="Invalid external network subnet name.")
+        target_ext_subnet = next((x for x in target_ext_network['subnets'] if x['name'].lower() == subnet.lower()), None)
 
-    endpoint_names = list(map(lambda x: x['name'].lower(), target_ext_subnet['endpoints']))
-    endpoint_name_overlap = endpoint.name.lower() in endpoint_names
+        if not target_ext_subnet:
+            raise HTTPException(status_code=400, detail="Invalid external network subnet name.")
 
-    if endpoint_name_overlap:
-        raise HTTPException(status_code=400, detail="Target endpoint name overlaps existing endpoint name.")
+        endpoint_names = list(map(lambda x: x['name'].lower(), target_ext_subnet['endpoints']))
+        endpoint_name_overlap = new_endpoint.name.lower() in endpoint_names
 
-    if not re.match(EXTENDPOINT_NAME_REGEX, endpoint.name, re.IGNORECASE):
-        raise HTTPException(status_code=400, detail="Endpoint names can be a maximum of 32 characters and may contain alphanumerics, underscores, hypens, and periods.")
+        if endpoint_name_overlap:
+            raise HTTPException(status_code=400, detail="Target endpoint name overlaps existing endpoint name.")
 
-    if not re.match(EXTENDPOINT_DESC_REGEX, endpoint.desc, re.IGNORECASE):
-        raise HTTPException(status_code=400, detail="Endpoint descriptions can be a maximum of 64 characters and may contain alphanumerics, spaces, underscores, hypens, slashes, and periods.")
+        if not re.match(EXTENDPOINT_NAME_REGEX, new_endpoint.name, re.IGNORECASE):
+            raise HTTPException(status_code=400, detail="Endpoint names can be a maximum of 32 characters and may contain alphanumerics, underscores, hypens, and periods.")
 
-    subnet_network = IPNetwork(target_ext_subnet['cidr'])
-    subnet_hosts_count = len(list(subnet_network.iter_hosts()))
+        if not re.match(EXTENDPOINT_DESC_REGEX, new_endpoint.desc, re.IGNORECASE):
+            raise HTTPException(status_code=400, detail="Endpoint descriptions can be a maximum of 64 characters and may contain alphanumerics, spaces, underscores, hypens, slashes, and periods.")
 
-    if len(target_ext_subnet['endpoints']) >= subnet_hosts_count:
-        raise HTTPException(status_code=400, detail="External subnet has reached maximum available host addresses.")
+        subnet_network = IPNetwork(target_ext_subnet['cidr'])
+        subnet_hosts = HostBitmap(subnet_network)
 
-    endpoint_addr_list = list(map(lambda x: x['ip'], target_ext_subnet['endpoints']))
-    endpoint_addr_set = IPSet(endpoint_addr_list)
+        if len(target_ext_subnet['endpoints']) >= subnet_hosts.count:
+            raise HTTPException(status_code=400, detail="External subnet has reached maximum available host addresses.")
 
-    if endpoint.ip is not None:
-        if (endpoint_addr_set & IPSet([IPAddress(endpoint.ip)])):
-            raise HTTPException(status_code=400, detail="Target endpoint IP address overlaps existing endpoint IP address.")
+        for existing in target_ext_subnet['endpoints']:
+            subnet_hosts.mark(existing['ip'])
 
-    if endpoint.ip is not None:
-        if not IPSet([endpoint.ip]).issubset(IPNetwork(target_ext_subnet['cidr'])):
-            raise HTTPException(status_code=400, detail="Target endpoint IP address outside the external subnet CIDR.")
+        if new_endpoint.ip is not None:
+            if IPAddress(new_endpoint.ip) in subnet_hosts:
+                raise HTTPException(status_code=400, detail="Target endpoint IP address overlaps existing endpoint IP address.")
 
-    if endpoint.ip is None:
-        available_set = endpoint_addr_set ^ IPSet(subnet_network.iter_hosts())
-        available_block = next((net for net in list(available_set.iter_cidrs()) if net.prefixlen <= 32), None)
-        next_ip = list(available_block.subnet(32))[0]
-        endpoint_addr_set.add(next_ip)
-        endpoint.ip = str(next_ip.ip)
+        if new_endpoint.ip is not None:
+            if IPAddress(new_endpoint.ip) not in subnet_network:
+                raise HTTPException(status_code=400, detail="Target endpoint IP address outside the external subnet CIDR.")
 
-    target_ext_subnet['endpoints'].append(jsonable_encoder(endpoint))
+        if new_endpoint.ip is None:
+            next_ip = subnet_hosts.next_free()
 
-    await cosmos_replace(space_query[0], target_space)
+            if next_ip is None:
+                raise HTTPException(status_code=400, detail="External subnet has reached maximum available host addresses.")
 
-    return endpoint
+            new_endpoint.ip = str(next_ip)
+
+        target_ext_subnet['endpoints'].append(jsonable_encoder(new_endpoint))
+
+        return new_endpoint
+
+    return await cosmos_mutate(
+        space_query[0],
+        add_endpoint,
+        "create_external_subnet_endpoint",
+        "Error creating external network subnet endpoint, please try again."
+    )
 
 @router.put(
     "/{space}/blocks/{block}/externals/{external}/subnets/{subnet}/endpoints",
@@ -2486,10 +2665,6 @@ async def create_external_subnet_endpoint(
     response_model = List[ExtEndpoint],
     status_code = 200
 )
-@cosmos_retry(
-    max_retry = 5,
-    error_msg = "Error updating external network subnet endpoints, please try again."
-)
 async def update_external_subnet_enpoints(
     endpoints: List[ExtEndpointReq],
     space: str = Path(..., description="Name of the target Space"),
@@ -2537,65 +2712,71 @@ async def update_external_subnet_enpoints(
     if invalid_descs:
         raise HTTPException(status_code=400, detail="Endpoint descriptions can be a maximum of 64 characters and may contain alphanumerics, spaces, underscores, hypens, slashes, and periods.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
-    try:
-        target_space = copy.deepcopy(space_query[0])
-    except:
+    if not space_query:
         raise HTTPException(status_code=400, detail="Invalid space name.")
 
-    target_block = next((x for x in target_space['blocks'] if x['name'].lower() == block.lower()), None)
+    def replace_endpoints(space_doc):
+        new_endpoints = copy.deepcopy(endpoints)
 
-    if not target_block:
-        raise HTTPException(status_code=400, detail="Invalid block name.")
+        target_block = next((x for x in space_doc['blocks'] if x['name'].lower() == block.lower()), None)
 
-    target_ext_network = next((x for x in target_block['externals'] if x['name'].lower() == external.lower()), None)
+        if not target_block:
+            raise HTTPException(status_code=400, detail="Invalid block name.")
 
-    if not target_ext_network:
-        raise HTTPException(status_code=400, detail="Invalid external network name.")
+        target_ext_network = next((x for x in target_block['externals'] if x['name'].lower() == external.lower()), None)
 
-    target_ext_subnet = next((x for x in target_ext_network['subnets'] if x['name'].lower() == subnet.lower()), None)
+        if not target_ext_network:
+            raise HTTPException(status_code=400, detail="Invalid external network name.")
 
-    if not target_ext_subnet:
-        raise HTTPException(status_code=400, detail="Invalid external network subnet name.")
+        target_ext_subnet = next((x for x in target_ext_network['subnets'] if x['name'].lower() == subnet.lower()), None)
 
-    subnet_network = IPNetwork(target_ext_subnet['cidr'])
-    subnet_hosts_count = len(list(subnet_network.iter_hosts()))
+        if not target_ext_subnet:
+            raise HTTPException(status_code=400, detail="Invalid external network subnet name.")
 
-    if subnet_hosts_count < len(endpoints):
-        raise HTTPException(status_code=400, detail="Number of endpoints exceeds available host addresses in subnet.")
+        subnet_network = IPNetwork(target_ext_subnet['cidr'])
+        subnet_hosts = HostBitmap(subnet_network)
 
-    endpoint_addr_overlap = False
-    endpoint_addr_set = IPSet([])
+        if subnet_hosts.count < len(new_endpoints):
+            raise HTTPException(status_code=400, detail="Number of endpoints exceeds available host addresses in subnet.")
 
-    for endpoint in endpoints:
-        if endpoint.ip is not None:
-            if not (endpoint_addr_set & IPSet([IPAddress(endpoint.ip)])):
-                endpoint_addr_set.add(IPAddress(endpoint.ip))
-            else:
-                endpoint_addr_overlap = True
+        endpoint_addr_overlap = False
+        endpoint_addrs_in_subnet = True
 
-    if endpoint_addr_overlap:
-        raise HTTPException(status_code=400, detail="List cannot contain overlapping endpoint IP addresses.")
+        for endpoint in new_endpoints:
+            if endpoint.ip is not None:
+                if not subnet_hosts.mark(endpoint.ip):
+                    endpoint_addr_overlap = True
 
-    endpoint_addrs_in_subnet = endpoint_addr_set.issubset(IPNetwork(target_ext_subnet['cidr']))
+                if IPAddress(endpoint.ip) not in subnet_network:
+                    endpoint_addrs_in_subnet = False
 
-    if not endpoint_addrs_in_subnet:
-        raise HTTPException(status_code=400, detail="List contains endpoint IP addresses outside the subnet CIDR.")
+        if endpoint_addr_overlap:
+            raise HTTPException(status_code=400, detail="List cannot contain overlapping endpoint IP addresses.")
 
-    for endpoint in endpoints:
-        if endpoint.ip is None:
-            available_set = endpoint_addr_set ^ IPSet(subnet_network.iter_hosts())
-            available_block = next((net for net in list(available_set.iter_cidrs()) if net.prefixlen <= 32), None)
-            next_ip = list(available_block.subnet(32))[0]
-            endpoint_addr_set.add(next_ip)
-            endpoint.ip = str(next_ip.ip)
+        if not endpoint_addrs_in_subnet:
+            raise HTTPException(status_code=400, detail="List contains endpoint IP addresses outside the subnet CIDR.")
 
-    target_ext_subnet['endpoints'] = jsonable_encoder(endpoints)
+        for endpoint in new_endpoints:
+            if endpoint.ip is None:
+                next_ip = subnet_hosts.next_free()
 
-    await cosmos_replace(space_query[0], target_space)
+                if next_ip is None:
+                    raise HTTPException(status_code=400, detail="Number of endpoints exceeds available host addresses in subnet.")
 
-    return target_ext_subnet['endpoints']
+                endpoint.ip = str(next_ip)
+
+        target_ext_subnet['endpoints'] = jsonable_encoder(new_endpoints)
+
+        return target_ext_subnet['endpoints']
+
+    return await cosmos_mutate(
+        space_query[0],
+        replace_endpoints,
+        "update_external_subnet_enpoints",
+        "Error updating external network subnet endpoints, please try again."
+    )
 
 @router.delete(
     "/{space}/blocks/{block}/externals/{external}/subnets/{subnet}/endpoints",
@@ -2625,7 +2806,7 @@ async def delete_external_subnet_endpoints(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2692,7 +2873,7 @@ async def get_external_subnet_endpoint(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2759,7 +2940,7 @@ async def update_ext_endpoint(
     if not is_admin:
         raise HTTPException(status_code=403, detail="This API is admin restricted.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2825,7 +3006,7 @@ async def delete_external_subnet_endpoint(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2878,7 +3059,7 @@ async def get_block_reservations(
 
     user_assertion = authorization.split(' ')[1]
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2899,6 +3080,14 @@ async def get_block_reservations(
         resv['space'] = target_space['name']
         resv['block'] = target_block['name']
 
+    if settled:
+        resv_ids = set(x['id'] for x in reservations)
+        archived = await get_archived_reservations(tenant_id, target_space['id'], target_block['name'])
+
+        for item in archived:
+            if item['reservation']['id'] not in resv_ids:
+                reservations.append(dict(item['reservation'], space = target_space['name'], block = target_block['name']))
+
     if not is_admin:
         user_name = get_username_from_jwt(user_assertion)
         return list(filter(lambda x: x['createdBy'] == user_name, reservations))
@@ -2911,10 +3100,6 @@ async def get_block_reservations(
     response_model = ReservationExpand,
     status_code = 201
 )
-@cosmos_retry(
-    max_retry = 5,
-    error_msg = "Error creating cidr reservation, please try again."
-)
 async def create_block_reservation(
     req: BlockCIDRReq,
     space: str = Path(..., description="Name of the target Space"),
@@ -2980,7 +3165,7 @@ async def create_block_reservation(
     user_assertion = authorization.split(' ')[1]
     decoded = jwt.decode(user_assertion, options={"verify_signature": False})
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -2994,73 +3179,75 @@ async def create_block_reservation(
 
     net_list = await get_network(authorization, True)
 
-    block_all_cidrs = []
-
-    for v in target_block['vnets']:
-        target = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
-        prefixes = list(filter(lambda x: IPNetwork(x) in IPNetwork(target_block['cidr']), target['prefixes'])) if target else []
-        block_all_cidrs += prefixes
-
-    for r in (r for r in target_block['resv'] if not r['settledOn']):
-        block_all_cidrs.append(r['cidr'])
-
-    for e in (e for e in target_block['externals']):
-        block_all_cidrs.append(e['cidr'])
+    if "preferred_username" in decoded:
+        creator_id = decoded["preferred_username"]
+    else:
+        creator_id = f"spn:{decoded['oid']}"
 
-    block_set = IPSet([target_block['cidr']])
-    reserved_set = IPSet(block_all_cidrs)
-    available_set = block_set ^ reserved_set
+    def reserve_cidr(space_doc):
+        target_block = next((x for x in space_doc['blocks'] if x['name'].lower() == block.lower()), None)
 
-    next_cidr = None
+        if not target_block:
+            raise HTTPException(status_code=400, detail="Invalid block name.")
 
-    if req.cidr is not None:
-        try:
-            next_cidr = IPNetwork(req.cidr)
-        except:
-            raise HTTPException(status_code=400, detail="Invalid network CIDR format.")
+        block_all_cidrs = []
 
-        if IPNetwork(req.cidr) not in available_set:
-            raise HTTPException(status_code=409, detail="Requested CIDR overlaps existing network(s).")
-    else:
-        available_slicer = slice(None, None, -1) if req.reverse_search else slice(None)
-        next_selector = -1 if req.reverse_search else 0
+        for v in target_block['vnets']:
+            target = next((x for x in net_list if x['id'].lower() == v['id'].lower()), None)
+            prefixes = list(filter(lambda x: prefix_in(x, target_block['cidr']), target['prefixes'])) if target else []
+            block_all_cidrs += prefixes
 
-        if req.smallest_cidr:
-            cidr_list = list(filter(lambda x: x.prefixlen <= req.size, available_set.iter_cidrs()[available_slicer]))
-            min_mask = max(map(lambda x: x.prefixlen, cidr_list))
-            available_block = next((net for net in list(filter(lambda network: network.prefixlen == min_mask, cidr_list))), None)
-        else:
-            available_block = next((net for net in list(available_set.iter_cidrs())[available_slicer] if net.prefixlen <= req.size), None)
+        for r in (r for r in target_block['resv'] if not r['settledOn']):
+            block_all_cidrs.append(r['cidr'])
 
-        if not available_block:
-            raise HTTPException(status_code=500, detail="Network of requested size unavailable in target block.")
+        for e in (e for e in target_block['externals']):
+            block_all_cidrs.append(e['cidr'])
 
-        next_cidr = list(available_block.subnet(req.size))[next_selector]
+        available_set = FreeSpace([target_block['cidr']], block_all_cidrs)
 
-    if "preferred_username" in decoded:
-        creator_id = decoded["preferred_username"]
-    else:
-        creator_id = f"spn:{decoded['oid']}"
+        next_cidr = None
 
-    new_cidr = {
-        "id": shortuuid.uuid(),
-        "cidr": str(next_cidr),
-        "desc": req.desc,
-        "createdOn": time.time(),
-        "createdBy": creator_id,
-        "settledOn": None,
-        "settledBy": None,
-        "status": "wait"
-    }
+        if req.cidr is not None:
+            try:
+                next_cidr = IPNetwork(req.cidr)
+            except:
+                raise HTTPException(status_code=400, detail="Invalid network CIDR format.")
 
-    target_block['resv'].append(new_cidr)
+            if IPNetwork(req.cidr) not in available_set:
+                raise HTTPException(status_code=409, detail="Requested CIDR overlaps existing network(s).")
+        else:
+            if req.smallest_cidr:
+                block_key = (tenant_id, space_doc['id'], target_block['name'].lower())
+                available_block = buddy_cache.get(block_key, target_block['cidr'], block_all_cidrs).find_block(req.size, req.reverse_search)
+            else:
+                available_block = available_set.find_block(req.size, req.reverse_search)
+
+            if not available_block:
+                raise HTTPException(status_code=500, detail="Network of requested size unavailable in target block.")
+
+            next_cidr = carve_subnet(available_block, req.size, req.reverse_search)
+
+        new_cidr = {
+            "id": shortuuid.uuid(),
+            "cidr": str(next_cidr),
+            "desc": req.desc,
+            "createdOn": time.time(),
+            "createdBy": creator_id,
+            "settledOn": None,
+            "settledBy": None,
+            "status": "wait"
+        }
 
-    await cosmos_replace(space_query[0], target_space)
+        target_block['resv'].append(new_cidr)
 
-    new_cidr['space'] = target_space['name']
-    new_cidr['block'] = target_block['name']
+        return dict(new_cidr, space = space_doc['name'], block = target_block['name'])
 
-    return new_cidr
+    return await cosmos_mutate(
+        space_query[0],
+        reserve_cidr,
+        "create_block_reservation",
+        "Error creating cidr reservation, please try again."
+    )
 
 @router.delete(
     "/{space}/blocks/{block}/reservations",
@@ -3088,7 +3275,7 @@ async def delete_block_reservations(
     user_assertion = authorization.split(' ')[1]
     user_name = get_username_from_jwt(user_assertion)
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -3106,7 +3293,14 @@ async def delete_block_reservations(
         raise HTTPException(status_code=400, detail="List contains one or more duplicate id's.")
 
     current_reservations = list(o['id'] for o in target_block['resv'])
-    ids_exist = all(elem in current_reservations for elem in req)
+    missing_ids = [elem for elem in req if elem not in current_reservations]
+    archived_reservations = []
+
+    if missing_ids:
+        archived = await get_archived_reservations(tenant_id, target_space['id'], target_block['name'])
+        archived_reservations = [x['reservation'] for x in archived if x['reservation']['id'] in missing_ids]
+
+    ids_exist = len(archived_reservations) == len(missing_ids)
 
     if not ids_exist:
         raise HTTPException(status_code=400, detail="List contains one or more invalid id's.")
@@ -3118,7 +3312,7 @@ async def delete_block_reservations(
     #     raise HTTPException(status_code=400, detail="List contains one or more settled reservations.")
 
     if not is_admin:
-        not_owned = list(filter(lambda x: x['id'] in req and x['createdBy'] != user_name, target_block['resv']))
+        not_owned = list(filter(lambda x: x['id'] in req and x['createdBy'] != user_name, target_block['resv'] + archived_reservations))
 
         if not_owned:
             raise HTTPException(status_code=403, detail="Users can only delete their own reservations.")
@@ -3156,7 +3350,7 @@ async def get_block_reservations(
 
     user_assertion = authorization.split(' ')[1]
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -3170,6 +3364,10 @@ async def get_block_reservations(
 
     target_reservation = next((x for x in target_block['resv'] if x['id'] == reservation), None)
 
+    if not target_reservation:
+        archived = await get_archived_reservations(tenant_id, target_space['id'], target_block['name'], reservation)
+        target_reservation = archived[0]['reservation'] if archived else None
+
     if not target_reservation:
         raise HTTPException(status_code=400, detail="Invalid reservation ID.")
 
@@ -3210,7 +3408,7 @@ async def delete_block_reservations(
     user_assertion = authorization.split(' ')[1]
     user_name = get_username_from_jwt(user_assertion)
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(space), tenant_id)
+    space_query = await get_space_docs(tenant_id, space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -3224,6 +3422,10 @@ async def delete_block_reservations(
 
     target_reservation = next((x for x in target_block['resv'] if x['id'] == reservation), None)
 
+    if not target_reservation:
+        archived = await get_archived_reservations(tenant_id, target_space['id'], target_block['name'], reservation)
+        target_reservation = archived[0]['reservation'] if archived else None
+
     if not target_reservation:
         raise HTTPException(status_code=400, detail="Invalid reservation ID.")
 
@@ -9,7 +9,7 @@ from typing import List
 
 import regex
 import copy
-from netaddr import IPSet, IPNetwork
+from netaddr import IPNetwork
 
 from app.dependencies import (
     api_auth_checks,
@@ -17,25 +17,34 @@ from app.dependencies import (
 )
 
 from app.models import *
-from . import argquery
 
 from app.routers.common.helper import (
-    cosmos_query,
+    get_space_docs,
     cosmos_retry,
-    arg_query,
     vnet_fixup
 )
 
 from app.routers.azure import (
-    get_network
+    get_network,
+    get_inventory,
+    get_inventory_snapshot
 )
 
+from app.routers.common.allocator import FreeSpace, buddy_cache, carve_subnet
+from app.routers.common.netindex import get_network_index, snapshot_key
+from app.routers.common.overlap import CIDRIndex
+
 router = APIRouter(
     prefix="/tools",
     tags=["tools"],
     dependencies=[Depends(api_auth_checks)]
 )
 
+CIDR_CHECK_BATCH_MAX = 1000
+NET_FIELDS = ('name', 'id', 'resource_group', 'subscription_id', 'tenant_id')
+
+cidr_indexes = {}
+
 @router.post(
     "/nextAvailableSubnet",
     summary = "Get Next Available Subnet in a Virtual Network",
@@ -70,8 +79,7 @@ async def next_available_subnet(
     if not valid_vnet:
         raise HTTPException(status_code=400, detail="Invalid Virtual Network ID.")
 
-    vnet_list = await arg_query(authorization, True, argquery.VNET)
-    vnet_list = vnet_fixup(vnet_list)
+    vnet_list, _ = await get_inventory(authorization, True, "vnet")
 
     vnet_all_cidrs = []
 
@@ -83,24 +91,14 @@ async def next_available_subnet(
     for subnet in target['subnets']:
         vnet_all_cidrs.append(subnet['prefix'])
 
-    vnet_set = IPSet(target['prefixes'])
-    reserved_set = IPSet(vnet_all_cidrs)
-    available_set = vnet_set ^ reserved_set
-
-    available_slicer = slice(None, None, -1) if req.reverse_search else slice(None)
-    next_selector = -1 if req.reverse_search else 0
+    available_set = FreeSpace(target['prefixes'], vnet_all_cidrs)
 
-    if req.smallest_cidr:
-        cidr_list = list(filter(lambda x: x.prefixlen <= req.size, available_set.iter_cidrs()[available_slicer]))
-        min_mask = max(map(lambda x: x.prefixlen, cidr_list))
-        available_block = next((net for net in list(filter(lambda network: network.prefixlen == min_mask, cidr_list))), None)
-    else:
-        available_block = next((net for net in list(available_set.iter_cidrs())[available_slicer] if net.prefixlen <= req.size), None)
+    available_block = available_set.find_block(req.size, req.reverse_search, req.smallest_cidr)
 
     if not available_block:
         raise HTTPException(status_code=500, detail="Subnet of requested size unavailable in target virtual network.")
 
-    next_cidr = list(available_block.subnet(req.size))[next_selector]
+    next_cidr = carve_subnet(available_block, req.size, req.reverse_search)
 
     new_cidr = {
         "vnet_name": target['name'],
@@ -140,7 +138,7 @@ async def next_available_vnet(
         - **false (default)**: New networks will be created using the first available block, regardless of size
     """
 
-    space_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'space' AND LOWER(c.name) = LOWER('{}')".format(req.space), tenant_id)
+    space_query = await get_space_docs(tenant_id, req.space)
 
     try:
         target_space = copy.deepcopy(space_query[0])
@@ -156,9 +154,6 @@ async def next_available_vnet(
 
     net_list = await get_network(authorization, True)
 
-    available_slicer = slice(None, None, -1) if req.reverse_search else slice(None)
-    next_selector = -1 if req.reverse_search else 0
-
     available_block = None
     available_block_name = None
 
@@ -179,23 +174,20 @@ async def next_available_vnet(
             for e in (e for e in target_block['externals']):
                 block_all_cidrs.append(e['cidr'])
 
-            block_set = IPSet([target_block['cidr']])
-            reserved_set = IPSet(block_all_cidrs)
-            available_set = block_set ^ reserved_set
-
             if req.smallest_cidr:
-                cidr_list = list(filter(lambda x: x.prefixlen <= req.size, available_set.iter_cidrs()[available_slicer]))
-                min_mask = max(map(lambda x: x.prefixlen, cidr_list))
-                available_block = next((net for net in list(filter(lambda network: network.prefixlen == min_mask, cidr_list))), None)
+                block_key = (tenant_id, target_space['id'], target_block['name'].lower())
+                available_set = buddy_cache.get(block_key, target_block['cidr'], block_all_cidrs)
+                available_block = available_set.find_block(req.size, req.reverse_search)
             else:
-                available_block = next((net for net in list(available_set.iter_cidrs())[available_slicer] if net.prefixlen <= req.size), None)
+                available_set = FreeSpace([target_block['cidr']], block_all_cidrs)
+                available_block = available_set.find_block(req.size, req.reverse_search)
 
             available_block_name = block if available_block else None
 
     if not available_block:
         raise HTTPException(status_code=500, detail="Network of requested size unavailable in target block(s).")
 
-    next_cidr = list(available_block.subnet(req.size))[next_selector]
+    next_cidr = carve_subnet(available_block, req.size, req.reverse_search)
 
     new_cidr = {
         "space": target_space['name'],
@@ -205,6 +197,35 @@ async def next_available_vnet(
 
     return new_cidr
 
+async def get_cidr_index(authorization, tenant_id):
+    """
+    Return the CIDRIndex for the current Space and network inventory snapshot.
+    The index is kept per tenant and only rebuilt once the Spaces have been
+    rewritten or either inventory list has been replaced by a refresh.
+    """
+
+    spaces = await get_space_docs(tenant_id)
+    space_key = snapshot_key(spaces)
+
+    vnet_list, _ = await get_inventory_snapshot(authorization, True, "vnet")
+    vhub_list, _ = await get_inventory_snapshot(authorization, True, "vhub")
+
+    cached = cidr_indexes.get(tenant_id)
+
+    if space_key is not None and cached and cached[0] == space_key and cached[1] is vnet_list and cached[2] is vhub_list:
+        return cached[3]
+
+    nets = [{**{k: x[k] for k in NET_FIELDS}, "prefixes": list(x['prefixes'])} for x in vnet_list]
+    nets += [{**{k: x[k] for k in NET_FIELDS}, "prefixes": [x['prefix']] if x['prefix'] else []} for x in vhub_list]
+    nets = vnet_fixup(nets)
+
+    cidr_index = CIDRIndex(spaces, nets, get_network_index(tenant_id, spaces))
+
+    if space_key is not None:
+        cidr_indexes[tenant_id] = (space_key, vnet_list, vhub_list, cidr_index)
+
+    return cidr_index
+
 @router.post(
     "/cidrCheck",
     summary = "Find Virtual Networks that Overlap a Given CIDR Range",
@@ -229,39 +250,46 @@ async def cidr_check(
     if IPNetwork(req.cidr).ip != IPNetwork(req.cidr).network:
         raise HTTPException(status_code=400, detail="Invalid CIDR range.")
 
-    spaces = await cosmos_query("SELECT * FROM c WHERE c.type = 'space'", tenant_id)
-
-    nets = await arg_query(authorization, True, argquery.NET_BASIC)
-
-    nets = vnet_fixup(nets)
+    cidr_index = await get_cidr_index(authorization, tenant_id)
 
-    overlap = [net for net in nets if IPSet([req.cidr]) & IPSet(net['prefixes'])]
+    return cidr_index.networks(str(req.cidr))
 
-    for item in overlap:
-        new_prefixes = []
+@router.post(
+    "/cidrCheck/batch",
+    summary = "Find Networks and IPAM Objects that Overlap a List of CIDR Ranges",
+    response_model = List[CIDRCheckBatchRes],
+    status_code = 200
+)
+@cosmos_retry(
+    max_retry = 5,
+    error_msg = "Error fetching overlapping networks, please try again."
+)
+async def cidr_check_batch(
+    req: CIDRCheckBatchReq,
+    authorization: str = Header(None, description="Azure Bearer token"),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """
+    Check a list of CIDR ranges against a single snapshot of the Azure networks and Spaces with the following information:
 
-        for prefix in item['prefixes']:
-            if IPSet([req.cidr]) & IPSet([prefix]):
-                new_prefixes.append(prefix)
+    - **cidrs**: Array of CIDR ranges (up to 1000)
 
-        item['prefixes'] = new_prefixes
+    The response contains one result per CIDR, in order, listing the overlapping Virtual Networks
+    (as returned by /cidrCheck) along with any overlapping Blocks, External Networks and
+    unsettled Reservations.
+    """
 
-        item['containers'] = []
+    if len(req.cidrs) > CIDR_CHECK_BATCH_MAX:
+        raise HTTPException(status_code=400, detail="A maximum of {} CIDR ranges can be checked at once.".format(CIDR_CHECK_BATCH_MAX))
 
-        for space in spaces:
-            for block in space['blocks']:
-                for vnet in block['vnets']:
-                    if vnet['id'] == item['id']:
-                        container = {
-                            "space": space['name'],
-                            "block": block['name']
-                        }
+    invalid_cidrs = [str(x) for x in req.cidrs if IPNetwork(str(x)).ip != IPNetwork(str(x)).network]
 
-                        # container = "/spaces/{}/blocks/{}".format(space['name'], block['name'])
+    if invalid_cidrs:
+        raise HTTPException(status_code=400, detail="Invalid CIDR range(s): {}".format(invalid_cidrs))
 
-                        item['containers'].append(container)
+    cidr_index = await get_cidr_index(authorization, tenant_id)
 
-    return overlap
+    return [cidr_index.check(str(x)) for x in req.cidrs]
 
 # Use below for new/experimental APIs:
 # <font color='red'>**EXPERIMENTAL**: This API is currently in testing and may change in future releases!</font>
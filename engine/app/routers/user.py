@@ -33,7 +33,9 @@ from app.routers.common.helper import (
     cosmos_query,
     cosmos_upsert,
     cosmos_replace,
-    cosmos_retry
+    cosmos_retry,
+    get_admin_entry,
+    get_user_docs
 )
 
 router = APIRouter(
@@ -123,17 +125,13 @@ async def get_users(
     if not is_admin:
         raise HTTPException(status_code=403, detail="API restricted to admins.")
 
-    users = await cosmos_query("SELECT VALUE c.data FROM c WHERE c.type = 'user'", tenant_id)
-    admin_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'admin'", tenant_id)
-
-    admins = admin_query[0]
+    users = [x['data'] for x in await get_user_docs(tenant_id)]
+    admin_entry = await get_admin_entry(tenant_id)
 
     for user in users:
-        is_admin = next((x for x in admins['admins'] if x['id'] == user['id']), None)
-
         current_user = {
             **user,
-            "isAdmin": True if is_admin else False
+            "isAdmin": user['id'] in admin_entry['admins']
         }
 
         user_list.append(current_user)
@@ -165,26 +163,25 @@ async def get_user(
     user_assertion = authorization.split(' ')[1]
     user_id = get_user_id_from_jwt(user_assertion)
 
-    user_query = await cosmos_query("SELECT * FROM c WHERE (c.type = 'user' AND c['data']['id'] = '{}')".format(user_id), tenant_id)
+    user_query = await get_user_docs(tenant_id, user_id)
 
     if not user_query:
         user_query = [await new_user(user_id, tenant_id)]
 
     user_data = copy.deepcopy(user_query[0])
 
-    admin_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'admin'", tenant_id)
-
-    if not admin_query:
-        admin_query = [await new_admin_db([], [], tenant_id)]
+    admin_entry = await get_admin_entry(tenant_id)
 
-    admins = admin_query[0]
+    if not admin_entry['doc']:
+        await new_admin_db([], [], tenant_id)
+        admin_entry = await get_admin_entry(tenant_id)
 
-    if admins['admins']:
-        is_admin = next((x for x in admins['admins'] if x['id'] == user_id), None)
+    if admin_entry['admins']:
+        is_admin = user_id in admin_entry['admins']
     else:
         is_admin = True
 
-    user_data['data']['isAdmin'] = True if is_admin else False
+    user_data['data']['isAdmin'] = is_admin
 
     if expand:
         return UserExpand(**user_data['data'])
@@ -222,7 +219,7 @@ async def update_user(
     user_assertion = authorization.split(' ')[1]
     user_id = get_user_id_from_jwt(user_assertion)
 
-    user_query = await cosmos_query("SELECT * FROM c WHERE (c.type = 'user' AND c['data']['id'] = '{}')".format(user_id), tenant_id)
+    user_query = await get_user_docs(tenant_id, user_id)
 
     if not user_query:
         user_query = [await new_user(user_id, tenant_id)]
@@ -242,12 +239,8 @@ async def update_user(
 
     await cosmos_replace(user_query[0], user_data)
 
-    admin_query = await cosmos_query("SELECT * FROM c WHERE c.type = 'admin'", tenant_id)
-
-    admins = admin_query[0]
-
-    is_admin = next((x for x in admins['admins'] if x['id'] == user_id), None)
+    admin_entry = await get_admin_entry(tenant_id)
 
-    user_data['data']['isAdmin'] = True if is_admin else False
+    user_data['data']['isAdmin'] = user_id in admin_entry['admins']
 
     return user_data['data']